@@ -0,0 +1,53 @@
+import os
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
+from app.email_agent import token_path_for, DEFAULT_USER_ID
+
+
+def parse_api_keys(value):
+    """Parses "key:user_id" pairs separated by commas into a dictionary of API key to user id."""
+    api_keys = {}
+    for pair in value.split(","):
+        key, _, user_id = pair.strip().partition(":")
+        if key and user_id:
+            api_keys[key] = user_id
+    return api_keys
+
+
+# Bearer keys of the accounts allowed to use the API. Without any, the server acts for the
+# single default account only and must not be reachable by anyone but its owner
+API_KEYS = parse_api_keys(os.getenv("MAILBUD_API_KEYS", ""))
+
+
+def user_for_authorization(authorization, api_keys):
+    """Returns the user id of the bearer key in an Authorization header, None if the key is unknown."""
+    scheme, _, key = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not key:
+        return None
+    for known_key, user_id in api_keys.items():
+        if hmac.compare_digest(known_key.encode(), key.strip().encode()):
+            return user_id
+    return None
+
+
+def authenticated_user_id(authorization: Optional[str] = Header(default=None)) -> str:
+    """
+    Resolves the account a request acts for from its bearer key, never from request parameters.
+    Accounts other than the default one must have signed in before, a request never starts a sign-in for them.
+    Returns:
+        str: The user id of the authenticated account
+    """
+    if not API_KEYS:
+        return DEFAULT_USER_ID
+
+    user_id = user_for_authorization(authorization, API_KEYS)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Missing or invalid API key", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        token_path = token_path_for(user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if user_id != DEFAULT_USER_ID and not os.path.exists(token_path):
+        raise HTTPException(status_code=403, detail=f"Account {user_id} has not signed in to Google")
+    return user_id
@@ -0,0 +1,87 @@
+import os
+import time
+import asyncio
+import hashlib
+import aiosqlite
+
+
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", "blobs.db")
+BLOB_STORE_MAX_AGE_DAYS = float(os.getenv("BLOB_STORE_MAX_AGE_DAYS", "7"))
+
+
+def blob_digest(payload):
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed SQLite store for large payloads referenced from graph state.
+
+    Payloads are keyed by their SHA-256 digest, so storing the same content twice
+    keeps a single copy. Storing a payload again renews it, and blobs not stored
+    for max_age_days are evicted.
+    """
+
+    def __init__(self, path=BLOB_STORE_PATH, max_age_days=BLOB_STORE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.conn = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._lock:
+            if self.conn is None:
+                conn = await aiosqlite.connect(self.path)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        digest TEXT PRIMARY KEY,
+                        payload TEXT NOT NULL,
+                        stored_at REAL NOT NULL
+                    )
+                """)
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_stored_at ON blobs (stored_at)")
+                await conn.commit()
+                self.conn = conn
+        return self.conn
+
+    async def put_many(self, payloads):
+        """
+        Stores the given payloads.
+        Args:
+            payloads: List of payload strings
+
+        Returns:
+            list: The digest of each payload, in input order
+        """
+        digests = [blob_digest(payload) for payload in payloads]
+        if not payloads:
+            return digests
+        conn = await self._connect()
+        now = time.time()
+        await conn.executemany(
+            "INSERT INTO blobs (digest, payload, stored_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (digest) DO UPDATE SET stored_at = excluded.stored_at",
+            [(digest, payload, now) for digest, payload in zip(digests, payloads)]
+        )
+        await conn.commit()
+        await self.evict()
+        return digests
+
+    async def get_many(self, digests):
+        """Returns a dict of digest to payload for the digests found in the store."""
+        if not digests:
+            return {}
+        conn = await self._connect()
+        placeholders = ",".join("?" * len(digests))
+        async with conn.execute(f"SELECT digest, payload FROM blobs WHERE digest IN ({placeholders})", list(digests)) as cursor:
+            return {digest: payload async for digest, payload in cursor}
+
+    async def evict(self):
+        conn = await self._connect()
+        await conn.execute("DELETE FROM blobs WHERE stored_at < ?", (time.time() - self.max_age,))
+        await conn.commit()
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
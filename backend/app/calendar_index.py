@@ -0,0 +1,51 @@
+from bisect import bisect_left
+from datetime import timedelta
+from app.timestamps import to_utc
+
+
+def event_bounds(event):
+    """
+    Returns the start and end of a Calendar event as UTC datetimes.
+    All-day events, which only carry a date, are taken to span whole UTC days.
+    Returns None for events whose times cannot be read.
+    """
+    start = event.get("start", {})
+    end = event.get("end", {})
+    start_at = to_utc(start.get("dateTime") or start.get("date"), start.get("timeZone"))
+    end_at = to_utc(end.get("dateTime") or end.get("date"), end.get("timeZone"))
+    if start_at is None or end_at is None:
+        return None
+    return start_at, end_at
+
+
+class IntervalIndex:
+    """
+    Sorted-interval index answering "which events overlap [start, end)" with a
+    binary search over event starts. Only events starting at most the longest
+    event duration before the query start need to be checked.
+    """
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, _, _ in self.intervals]
+        self.max_duration = max((end - start for start, end, _ in self.intervals), default=timedelta(0))
+
+    @classmethod
+    def from_events(cls, events):
+        intervals = []
+        for event in events:
+            bounds = event_bounds(event)
+            if bounds is None:
+                print(f"Skipping event with unreadable times: {event.get('id')}")
+                continue
+            intervals.append((bounds[0], bounds[1], event))
+        return cls(intervals)
+
+    def overlapping(self, start, end):
+        """Returns the items overlapping [start, end), ordered by start."""
+        low = bisect_left(self.starts, start - self.max_duration)
+        high = bisect_left(self.starts, end)
+        return [item for item_start, item_end, item in self.intervals[low:high] if item_end > start]
+
+    def __len__(self):
+        return len(self.intervals)
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import asyncio
+import aiosqlite
+from datetime import datetime, timedelta, timezone
+from googleapiclient.errors import HttpError
+from app.google_api import execute_request
+from app.calendar_index import event_bounds
+
+
+CALENDAR_MIRROR_PATH = os.getenv("CALENDAR_MIRROR_PATH", "calendar_mirror.db")
+CALENDAR_MIRROR_WINDOW_DAYS = float(os.getenv("CALENDAR_MIRROR_WINDOW_DAYS", "90"))
+# A mirror synced more recently than this is used without asking the API for changes
+CALENDAR_MIRROR_MAX_STALENESS_SECONDS = float(os.getenv("CALENDAR_MIRROR_MAX_STALENESS_SECONDS", "60"))
+
+
+class CalendarMirror:
+    """
+    Local SQLite copy of a calendar's events for a rolling window, kept apart per account.
+
+    The first sync lists the window (from one day ago to window_days ahead) and
+    keeps the nextSyncToken. Later syncs only fetch changes since that token, and
+    a token rejected with 410 Gone, or a window running out, triggers a full resync.
+    Events are indexed by start and end time for range queries.
+    """
+
+    def __init__(self, path=CALENDAR_MIRROR_PATH, window_days=CALENDAR_MIRROR_WINDOW_DAYS, max_staleness=CALENDAR_MIRROR_MAX_STALENESS_SECONDS):
+        self.path = path
+        self.window = timedelta(days=window_days)
+        self.max_staleness = max_staleness
+        self.conn = None
+        self._lock = asyncio.Lock()
+        self._sync_locks = {}
+
+    async def _connect(self):
+        async with self._lock:
+            if self.conn is None:
+                conn = await aiosqlite.connect(self.path)
+                # Mirrors written before events were scoped by account cannot be attributed, start over
+                async with conn.execute("PRAGMA table_info(sync_state)") as cursor:
+                    columns = [row[1] async for row in cursor]
+                if columns and "account" not in columns:
+                    await conn.execute("DROP TABLE IF EXISTS events")
+                    await conn.execute("DROP TABLE sync_state")
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS events (
+                        account TEXT NOT NULL,
+                        calendar_id TEXT NOT NULL,
+                        event_id TEXT NOT NULL,
+                        start_ts REAL NOT NULL,
+                        end_ts REAL NOT NULL,
+                        payload TEXT NOT NULL,
+                        PRIMARY KEY (account, calendar_id, event_id)
+                    )
+                """)
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_events_start ON events (account, calendar_id, start_ts)")
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_events_end ON events (account, calendar_id, end_ts)")
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS sync_state (
+                        account TEXT NOT NULL,
+                        calendar_id TEXT NOT NULL,
+                        sync_token TEXT,
+                        window_start REAL NOT NULL,
+                        window_end REAL NOT NULL,
+                        synced_at REAL NOT NULL,
+                        PRIMARY KEY (account, calendar_id)
+                    )
+                """)
+                await conn.commit()
+                self.conn = conn
+        return self.conn
+
+    async def _sync_state(self, account, calendar_id):
+        conn = await self._connect()
+        async with conn.execute(
+            "SELECT sync_token, window_start, window_end, synced_at FROM sync_state WHERE account = ? AND calendar_id = ?",
+            (account, calendar_id)
+        ) as cursor:
+            return await cursor.fetchone()
+
+    async def _list_pages(self, service, **params):
+        """Lists events page by page, returning them with the nextSyncToken of the last page."""
+        events = []
+        page_token = None
+        while True:
+            response = await execute_request(service.events().list(singleEvents=True, pageToken=page_token, **params))
+            events.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return events, response.get("nextSyncToken")
+
+    async def _apply(self, account, calendar_id, events):
+        conn = await self._connect()
+        for event in events:
+            bounds = event_bounds(event) if event.get("status") != "cancelled" else None
+            if bounds is None:
+                await conn.execute(
+                    "DELETE FROM events WHERE account = ? AND calendar_id = ? AND event_id = ?", (account, calendar_id, event["id"])
+                )
+            else:
+                await conn.execute(
+                    "INSERT OR REPLACE INTO events (account, calendar_id, event_id, start_ts, end_ts, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                    (account, calendar_id, event["id"], bounds[0].timestamp(), bounds[1].timestamp(), json.dumps(event))
+                )
+
+    async def _full_sync(self, service, account, calendar_id):
+        now = datetime.now(timezone.utc)
+        window_start, window_end = now - timedelta(days=1), now + self.window
+        events, sync_token = await self._list_pages(
+            service, calendarId=calendar_id, timeMin=window_start.isoformat(), timeMax=window_end.isoformat()
+        )
+        conn = await self._connect()
+        await conn.execute("DELETE FROM events WHERE account = ? AND calendar_id = ?", (account, calendar_id))
+        await self._apply(account, calendar_id, events)
+        await conn.execute(
+            "INSERT OR REPLACE INTO sync_state (account, calendar_id, sync_token, window_start, window_end, synced_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (account, calendar_id, sync_token, window_start.timestamp(), window_end.timestamp(), time.time())
+        )
+        await conn.commit()
+        print(f"Calendar mirror fully synced {len(events)} events of {account}/{calendar_id}")
+
+    async def _incremental_sync(self, service, account, calendar_id, sync_token):
+        events, next_token = await self._list_pages(service, calendarId=calendar_id, syncToken=sync_token)
+        conn = await self._connect()
+        await self._apply(account, calendar_id, events)
+        # Events that ended before the window are no longer needed
+        await conn.execute(
+            "DELETE FROM events WHERE account = ? AND calendar_id = ? AND end_ts < ?",
+            (account, calendar_id, time.time() - 24 * 60 * 60)
+        )
+        await conn.execute(
+            "UPDATE sync_state SET sync_token = ?, synced_at = ? WHERE account = ? AND calendar_id = ?",
+            (next_token or sync_token, time.time(), account, calendar_id)
+        )
+        await conn.commit()
+        print(f"Calendar mirror applied {len(events)} changes to {account}/{calendar_id}")
+
+    async def sync(self, service, account, calendar_id="primary", force=False):
+        """
+        Brings the mirror of an account's calendar up to date, unless it was synced within max_staleness seconds.
+        Args:
+            service: Authorized Calendar API service instance of the account
+            account: The account the calendar belongs to
+            calendar_id: The calendar to mirror
+            force: Sync even when the mirror is fresh
+        """
+        lock = self._sync_locks.setdefault((account, calendar_id), asyncio.Lock())
+        async with lock:
+            state = await self._sync_state(account, calendar_id)
+            if state is None or state[0] is None:
+                return await self._full_sync(service, account, calendar_id)
+
+            sync_token, _, window_end, synced_at = state
+            # Roll the window forward once half of it has elapsed
+            if window_end - time.time() < self.window.total_seconds() / 2:
+                return await self._full_sync(service, account, calendar_id)
+            if not force and time.time() - synced_at < self.max_staleness:
+                return
+
+            try:
+                await self._incremental_sync(service, account, calendar_id, sync_token)
+            except HttpError as error:
+                if error.resp.status != 410:
+                    raise
+                print(f"Sync token of {account}/{calendar_id} expired, running a full resync")
+                await self._full_sync(service, account, calendar_id)
+
+    async def covers(self, account, calendar_id, start, end):
+        """Checks whether [start, end) lies within the mirrored window of an account's calendar."""
+        state = await self._sync_state(account, calendar_id)
+        return state is not None and state[1] <= start.timestamp() and end.timestamp() <= state[2]
+
+    async def events_between(self, account, calendar_id, start, end):
+        """Returns the mirrored events of an account's calendar overlapping [start, end), ordered by start."""
+        conn = await self._connect()
+        async with conn.execute(
+            "SELECT payload FROM events WHERE account = ? AND calendar_id = ? AND start_ts < ? AND end_ts > ? ORDER BY start_ts",
+            (account, calendar_id, end.timestamp(), start.timestamp())
+        ) as cursor:
+            return [json.loads(payload) async for (payload,) in cursor]
+
+    async def upsert_event(self, account, calendar_id, event):
+        """Records an event created or updated by this server without waiting for the next sync."""
+        await self._apply(account, calendar_id, [event])
+        await self.conn.commit()
+
+    async def delete_event(self, account, calendar_id, event_id):
+        conn = await self._connect()
+        await conn.execute(
+            "DELETE FROM events WHERE account = ? AND calendar_id = ? AND event_id = ?", (account, calendar_id, event_id)
+        )
+        await conn.commit()
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
@@ -3,31 +3,87 @@ from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 import os
 import os.path
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from pydantic import BaseModel, Field
-from typing import List, Annotated , TypedDict, Literal, Dict
-from operator import add
+from typing import List, Annotated , TypedDict, Literal, Dict, Optional, NotRequired
 from langgraph.graph import MessagesState
 from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+import re
 import json
+import hashlib
 from datetime import datetime, timezone
 from langgraph.graph import START, END, StateGraph
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 import aiosqlite
 import asyncio
-from functools import partial
+from app.google_api import execute_request, execute_batch, build_service
+from app.inbox_sync import InboxSync
+from app.thread_store import ThreadStore, NOT_QUALIFIED
+from app.gmail_query import ThreadQuery
+from app.timestamps import normalize_rfc3339, to_utc
+from app.extraction_cache import ExtractionCache, thread_content_hash
+from app.prefilter import prefilter_threads
+from app.llm_gateway import LLMGateway
+from app.calendar_index import IntervalIndex, event_bounds
+from app.calendar_mirror import CalendarMirror
+from app.meeting_ledger import MeetingLedger
+from app.blob_store import BlobStore
+from app.service_registry import ServiceRegistry
+from app.token_manager import TokenManager
 
 
 
-async def get_memory():
-    conn = await aiosqlite.connect(":memory:")
-    return AsyncSqliteSaver(conn)
-
 load_dotenv()
+
+# Checkpointer backend: "sqlite" (file shared by all workers), "postgres" or "memory" (single process only)
+CHECKPOINTER_BACKEND = os.getenv("CHECKPOINTER_BACKEND", "sqlite")
+CHECKPOINTER_PATH = os.getenv("CHECKPOINTER_PATH", "checkpoints.db")
+CHECKPOINTER_URL = os.getenv("CHECKPOINTER_URL", "")
+CHECKPOINTER_POOL_SIZE = int(os.getenv("CHECKPOINTER_POOL_SIZE", "10"))
+
+
+async def get_memory(backend=None):
+    """
+    Returns the checkpointer selected by CHECKPOINTER_BACKEND.
+    The SQLite file runs in WAL mode with a busy timeout, so several uvicorn workers
+    can read and write the same sessions. Postgres uses a connection pool and needs
+    the langgraph-checkpoint-postgres and psycopg-pool packages.
+    """
+    backend = backend or CHECKPOINTER_BACKEND
+    if backend == "memory":
+        conn = await aiosqlite.connect(":memory:")
+        return AsyncSqliteSaver(conn)
+
+    if backend == "sqlite":
+        conn = await aiosqlite.connect(CHECKPOINTER_PATH, timeout=30)
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA busy_timeout=30000")
+        memory = AsyncSqliteSaver(conn)
+        await memory.setup()
+        return memory
+
+    if backend == "postgres":
+        try:
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+            from psycopg_pool import AsyncConnectionPool
+        except ImportError as e:
+            raise ImportError("The postgres checkpointer needs: pip install langgraph-checkpoint-postgres psycopg-pool") from e
+        pool = AsyncConnectionPool(
+            conninfo=CHECKPOINTER_URL,
+            max_size=CHECKPOINTER_POOL_SIZE,
+            kwargs={"autocommit": True, "prepare_threshold": 0},
+            open=False
+        )
+        await pool.open()
+        memory = AsyncPostgresSaver(pool)
+        await memory.setup()
+        return memory
+
+    raise ValueError(f"Unknown checkpointer backend: {backend}")
+
 def set_env_vars(var):
     value = os.getenv(var)
     if value is not None:
@@ -45,6 +101,9 @@ llm_o3_mini = ChatOpenAI(model="o3-mini", reasoning_effort="high")
 llm_anthropic = ChatAnthropic(model="claude-3-5-sonnet-20240620", temperature=0)
 llm = llm_4o
 
+# All model calls go through the gateway for rate limiting, retries and timeouts
+llm_gateway = LLMGateway()
+
 
 
 
@@ -55,6 +114,9 @@ SCOPES = [
     "https://www.googleapis.com/auth/calendar.events.readonly"
 ]
 
+# Credentials of every account, refreshed in the background ahead of expiry
+token_manager = TokenManager(SCOPES)
+
 class ServiceAuthenticator:
     def __init__(self, credentials_path='credentials.json', token_path='token.json'):
         self.credentials_path = credentials_path
@@ -62,46 +124,70 @@ class ServiceAuthenticator:
         self.creds = None  # Initialize as None, will be set when get_credentials is called
         
     async def get_credentials(self):
-        """Gets valid user credentials from storage or initiates OAuth2 flow."""
+        """Gets valid user credentials from the token manager or initiates OAuth2 flow."""
         if self.creds is None:  # Only get credentials if not already set
-            creds = None
-            
-            if os.path.exists(self.token_path):
+            creds = await token_manager.get(self.token_path)
+
+            if not creds:
                 try:
-                    creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        self.credentials_path, SCOPES)
+                    creds = await flow.run_local_server_async()
                 except Exception as e:
-                    print(f"Error loading existing credentials: {e}")
-                    
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    try:
-                        creds.refresh(Request())
-                    except Exception as e:
-                        print(f"Error refreshing credentials: {e}")
-                        creds = None
-                
-                if not creds:
-                    try:
-                        flow = InstalledAppFlow.from_client_secrets_file(
-                            self.credentials_path, SCOPES)
-                        creds = await flow.run_local_server_async()
-                    except Exception as e:
-                        print(f"Error in OAuth flow: {e}")
-                        raise
-            
+                    print(f"Error in OAuth flow: {e}")
+                    raise
+                await token_manager.register(self.token_path, creds)
+
             self.creds = creds
-        
+
         return self.creds
 
     async def get_gmail_service(self):
         """Returns an authorized Gmail API service instance."""
         creds = await self.get_credentials()
-        return build('gmail', 'v1', credentials=creds)
+        return build_service('gmail', 'v1', creds)
 
     async def get_calendar_service(self):
         """Returns an authorized Calendar API service instance."""
         creds = await self.get_credentials()
-        return build('calendar', 'v3', credentials=creds)
+        return build_service('calendar', 'v3', creds)
+
+
+# Account used when the graph config carries no user_id, authenticated with token.json
+DEFAULT_USER_ID = "default"
+# Tokens of the other accounts are stored as <GOOGLE_TOKEN_DIR>/<user_id>.json
+GOOGLE_TOKEN_DIR = os.getenv("GOOGLE_TOKEN_DIR", "tokens")
+USER_ID_PATTERN = re.compile(r"[A-Za-z0-9_@-][A-Za-z0-9_.@-]{0,127}")
+
+def token_path_for(user_id):
+    """Returns the token file of an account, rejecting user ids that are not safe as a file name."""
+    if user_id == DEFAULT_USER_ID:
+        return "token.json"
+    if not USER_ID_PATTERN.fullmatch(user_id):
+        raise ValueError(f"Invalid user id: {user_id!r}")
+    return os.path.join(GOOGLE_TOKEN_DIR, f"{user_id}.json")
+
+def user_id_of(config):
+    """Returns the account a graph run acts for, from config["configurable"]["user_id"]."""
+    return ((config or {}).get("configurable") or {}).get("user_id") or DEFAULT_USER_ID
+
+# Authenticated clients of every account, shared by all sessions of the account
+service_registry = ServiceRegistry(lambda user_id: ServiceAuthenticator(token_path=token_path_for(user_id)))
+
+async def account_services(config):
+    """Returns the clients of the account a run acts for, recording the use so its token is kept refreshed."""
+    user_id = user_id_of(config)
+    token_manager.touch(token_path_for(user_id))
+    return await service_registry.get(user_id)
+
+async def prewarm_services(user_id=DEFAULT_USER_ID):
+    """Builds the clients of an account ahead of its first session, when its stored token works without a browser sign-in."""
+    try:
+        if await token_manager.get(token_path_for(user_id)):
+            await service_registry.get(user_id)
+            print(f"Pre-built Gmail and Calendar clients for {user_id}")
+    except Exception as e:
+        print(f"Could not pre-build the clients of {user_id}: {e}")
 
 
 class Message(TypedDict):
@@ -110,15 +196,17 @@ class Message(TypedDict):
     from_: str  = Field(alias="from")
     to: List[str]
     timestamp: str
+    has_calendar_invite: NotRequired[bool]
     
 
 class Thread(BaseModel):
     thread_id: str
     subject: str
-    messages: Annotated[List[Message], Field(description="List of messages in the thread"), add]
+    messages: Annotated[List[Message], Field(description="List of messages in the thread")]
 
-class Threads(BaseModel):
-    threads: Annotated[List[Thread], Field(description="List of threads"), add]
+class ThreadRef(TypedDict):
+    thread_id: str
+    digest: str
 
 
 class Date(BaseModel):
@@ -133,6 +221,7 @@ class MeetingDetails(BaseModel):
     location: str
     description: str
     attendees: List[str] = Field(description="The list of email addresses of the attendees, in the format: [\"email@example.com\", \"email2@example.com\"]")
+    thread_id: Optional[str] = Field(default=None, description="The thread ID of the email thread the meeting details were found in")
     
 
 class MeetingDetailsList(BaseModel):
@@ -147,35 +236,132 @@ class Resolution(BaseModel):
     resolution_description: str = Field(description="A description of how users input was used to resolve the conflicting events or make updates to the events")
 
 class AgentState(MessagesState):
-    threads_with_messages: Threads
+    # Threads live in the blob store, checkpoints only carry their digests
+    thread_refs: List[ThreadRef]
     meeting_details: MeetingDetailsList
     meetings_scheduled: List[Dict]
     events_to_be_scheduled: List[Dict]
     conflicting_events: List[ConflictingEvents]
     resolution_input: HumanMessage
     resolution_output: str
+    conflict_snapshot: Dict[str, List[Dict]]
+    meetings_failed: List[Dict]
+    # Inbox history reached by this run, committed once its threads are extracted
+    sync_cursor: Optional[Dict]
     
-gmail_service = []
-calendar_service = []
-
-async def complete_auth(state: AgentState):
-    global gmail_service, calendar_service
-    auth = ServiceAuthenticator()
-    gmail_service = await auth.get_gmail_service()
-    calendar_service = await auth.get_calendar_service()
+
+# Inbox scan: threads per threads.list page and total number of threads
+GMAIL_PAGE_SIZE = int(os.getenv("GMAIL_PAGE_SIZE", "50"))
+GMAIL_MAX_THREADS = int(os.getenv("GMAIL_MAX_THREADS", "50"))
+
+# Thread selection pushed down to Gmail (labels, categories, age window, senders, keywords)
+THREAD_QUERY = ThreadQuery.from_env()
+
+# Maximum number of threads.get calls in flight while hydrating the inbox
+THREAD_FETCH_CONCURRENCY = int(os.getenv("THREAD_FETCH_CONCURRENCY", "10"))
+
+# How threads are fetched: "concurrent" individual requests or grouped "batch" HTTP requests
+GMAIL_FETCH_MODE = os.getenv("GMAIL_FETCH_MODE", "concurrent")
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+
+# Only fetch threads changed since the last run, tracked through the Gmail historyId
+GMAIL_INCREMENTAL_SYNC = os.getenv("GMAIL_INCREMENTAL_SYNC", "false").lower() == "true"
+inbox_sync = InboxSync()
+
+# Reuse parsed threads from a local SQLite store while their historyId is unchanged
+THREAD_STORE_ENABLED = os.getenv("THREAD_STORE_ENABLED", "false").lower() == "true"
+thread_store = ThreadStore()
+
+# Meeting extraction: prompt size of a chunk of threads and number of chunks extracted at once
+EXTRACTION_CHUNK_TOKENS = int(os.getenv("EXTRACTION_CHUNK_TOKENS", "8000"))
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))
+extraction_cache = ExtractionCache()
+
+# Answer conflict checks from a local, syncToken-updated copy of the calendar
+CALENDAR_MIRROR_ENABLED = os.getenv("CALENDAR_MIRROR_ENABLED", "false").lower() == "true"
+calendar_mirror = CalendarMirror()
+
+# Maximum number of independent meetings committed to the calendar at once
+CALENDAR_WRITE_CONCURRENCY = int(os.getenv("CALENDAR_WRITE_CONCURRENCY", "5"))
+
+# Meetings already committed, so replays of create_meeting_events skip them
+meeting_ledger = MeetingLedger()
+
+# Parsed threads referenced by thread_refs in the graph state
+blob_store = BlobStore()
+
+# Skip threads without scheduling signals (dates, times, meeting words, invites) before extraction.
+# Off by default: the filter is heuristic and the threads it drops are never shown to the model
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "false").lower() == "true"
+
+# Screen threads with a cheap metadata fetch before downloading the ones that qualify
+GMAIL_TWO_PHASE_FETCH = os.getenv("GMAIL_TWO_PHASE_FETCH", "true").lower() == "true"
+
+METADATA_FETCH_PARAMS = {
+    "format": "metadata",
+    "metadataHeaders": ["Subject", "From", "To", "Cc", "Date"],
+    "fields": "id,historyId,messages(id,labelIds,payload/headers)"
+}
+FULL_FETCH_PARAMS = {
+    "format": "full",
+    "fields": "id,historyId,messages(id,snippet,payload(headers,mimeType,filename,parts(mimeType,filename,parts(mimeType,filename))))"
+}
+
+async def complete_auth(state: AgentState, config: RunnableConfig = None):
+    await account_services(config)
     return {"messages": ["Google account authenticated to access Gmail and Calendar, Fetching email threads from Gmail inbox..."]}
 
 
 
-async def get_threads(gmail_service):
+async def iter_thread_pages(gmail_service, page_size=None, newer_than=None, max_threads=None, query=None):
+    """
+    Lists inbox threads page by page, newest first, following nextPageToken lazily.
+    Args:
+        gmail_service: Authorized Gmail API service instance
+        page_size: Number of threads requested per page, defaults to GMAIL_PAGE_SIZE
+        newer_than: Gmail relative age such as "30d", overrides the one of the query
+        max_threads: Maximum number of threads listed in total, defaults to GMAIL_MAX_THREADS
+        query: ThreadQuery selecting the threads, defaults to THREAD_QUERY
+
+    Yields:
+        list: Thread stubs of one page
+    """
+    page_size = page_size or GMAIL_PAGE_SIZE
+    max_threads = max_threads or GMAIL_MAX_THREADS
+    query = query or THREAD_QUERY
+    if newer_than is not None:
+        query = query.model_copy(update={"newer_than": newer_than})
+    query_params = query.compile()
+
+    listed = 0
+    page_token = None
+    while listed < max_threads:
+        params = {"userId": "me", "maxResults": min(page_size, max_threads - listed), **query_params}
+        if page_token:
+            params["pageToken"] = page_token
+
+        response = await execute_request(gmail_service.users().threads().list(**params))
+        threads = response.get("threads", [])
+        if not threads:
+            break
+
+        listed += len(threads)
+        yield threads
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+async def list_threads(gmail_service, **scan_options):
+    """Lists the thread stubs of every page, letting API errors propagate."""
+    threads = []
+    async for page in iter_thread_pages(gmail_service, **scan_options):
+        threads.extend(page)
+    return threads
+
+async def get_threads(gmail_service, **scan_options):
     try:
-        
-        loop = asyncio.get_event_loop()
-        threads = await loop.run_in_executor(
-            None, 
-            partial(gmail_service.users().threads().list(userId="me", maxResults=50).execute)
-        )
-        return threads.get("threads", [])
+        return await list_threads(gmail_service, **scan_options)
     except HttpError as error:
         print(f"An error occurred: {error}")
 
@@ -214,6 +400,21 @@ async def get_timestamp(message):
             return header['value']
     return None
 
+def is_calendar_part(part):
+    mime_type = part.get("mimeType", "").lower()
+    filename = part.get("filename", "").lower()
+    if mime_type in ("text/calendar", "application/ics") or filename.endswith(".ics"):
+        return True
+    return any(is_calendar_part(subpart) for subpart in part.get("parts", []))
+
+async def has_calendar_invite(message):
+    """Checks for a text/calendar part, an .ics attachment or an Outlook calendar message header."""
+    payload = message.get('payload', {})
+    for header in payload.get('headers', []):
+        if header['name'].lower() == 'content-class' and 'calendarmessage' in header['value'].lower():
+            return True
+    return is_calendar_part(payload)
+
 async def process_message(message) -> Message:
     msg_id = message["id"]
     msg_body = message.get("snippet", "")
@@ -225,49 +426,281 @@ async def process_message(message) -> Message:
         msg_body=msg_body,
         from_=sender,
         to=recipients,
-        timestamp=timestamp
+        timestamp=timestamp,
+        has_calendar_invite=await has_calendar_invite(message)
     )
 
-async def get_threads_with_messages(state: AgentState):
-    global gmail_service
-    threads_with_messages = Threads(threads=[])
-    try:
-        service = gmail_service
-        print("Getting threads")
-        threads = await get_threads(gmail_service)
-        print("Threads retrieved : ", threads)
-        
-        for thread in threads:
-            thread_id = thread["id"]
-            
-            # Get thread data in a single API call
-            loop = asyncio.get_event_loop()
-            tdata = await loop.run_in_executor(
-                None, 
-                partial(service.users().threads().get(
-                    userId="me", 
-                    id=thread["id"], 
-                    format='full' 
-                ).execute)
-            )
-            print("Thread data retrieved ")
-            
-            if len(tdata["messages"]) > 2: 
-                
-                messages = await asyncio.gather(*(process_message(message) for message in tdata["messages"]))
+def min_messages_rule(min_messages):
+    """Eligibility rule accepting threads with at least min_messages messages."""
+    def rule(tdata):
+        return len(tdata.get("messages", [])) >= min_messages
+    return rule
+
+# Rules deciding from thread metadata whether a thread is worth a full fetch, all of them must pass
+THREAD_ELIGIBILITY_RULES = [min_messages_rule(3)]
+
+def is_eligible_thread(tdata, rules=None):
+    return all(rule(tdata) for rule in (THREAD_ELIGIBILITY_RULES if rules is None else rules))
+
+def thread_request(service, thread_id, **params):
+    return service.users().threads().get(userId="me", id=thread_id, **(params or FULL_FETCH_PARAMS))
+
+async def fetch_thread(service, thread_id, semaphore, **params):
+    """Fetches a single thread, returning None if the request fails."""
+    async with semaphore:
+        try:
+            return await execute_request(thread_request(service, thread_id, **params))
+        except HttpError as error:
+            print(f"An error occurred fetching thread {thread_id}: {error}")
+            return None
+
+async def fetch_threads_batched(service, threads, batch_size=GMAIL_BATCH_SIZE, **params):
+    """Fetches threads through Gmail batch requests, returning None for threads that failed."""
+    requests = [thread_request(service, thread["id"], **params) for thread in threads]
+    responses = await execute_batch(service, requests, batch_size=batch_size)
+
+    threads_data = []
+    for thread, response in zip(threads, responses):
+        if isinstance(response, Exception):
+            print(f"An error occurred fetching thread {thread['id']}: {response}")
+            response = None
+        threads_data.append(response)
+    return threads_data
+
+async def hydrate_threads(service, threads, concurrency=THREAD_FETCH_CONCURRENCY, mode=None, **params):
+    """
+    Fetches the data of the given threads, concurrently or in batch requests.
+    Args:
+        service: Authorized Gmail API service instance
+        threads: Thread stubs as returned by get_threads
+        concurrency: Maximum number of requests in flight at once
+        mode: "concurrent" or "batch", defaults to GMAIL_FETCH_MODE
+        params: threads.get parameters, defaults to FULL_FETCH_PARAMS
+
+    Returns:
+        list: Thread data in the same order as the input, None for threads that failed
+    """
+    if (mode or GMAIL_FETCH_MODE) == "batch":
+        return await fetch_threads_batched(service, threads, **params)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    return await asyncio.gather(*(fetch_thread(service, thread["id"], semaphore, **params) for thread in threads))
+
+async def screen_threads(service, threads, rules=None):
+    """
+    Decides which threads qualify for extraction.
+    With GMAIL_TWO_PHASE_FETCH the decision is made on a metadata-only fetch and
+    only qualifying threads are downloaded with FULL_FETCH_PARAMS.
 
+    Returns:
+        tuple: (thread stub, full thread data) pairs of qualifying threads, and
+        (thread stub, thread data) pairs of threads that did not qualify
+    """
+    if not GMAIL_TWO_PHASE_FETCH:
+        threads_data = await hydrate_threads(service, threads, **FULL_FETCH_PARAMS)
+        pairs = [(thread, tdata) for thread, tdata in zip(threads, threads_data) if tdata is not None]
+        eligible = [(thread, tdata) for thread, tdata in pairs if is_eligible_thread(tdata, rules)]
+        rejected = [(thread, tdata) for thread, tdata in pairs if not is_eligible_thread(tdata, rules)]
+        return eligible, rejected
+
+    metadata = await hydrate_threads(service, threads, **METADATA_FETCH_PARAMS)
+    candidates, rejected = [], []
+    for thread, tdata in zip(threads, metadata):
+        if tdata is None:
+            continue
+        if is_eligible_thread(tdata, rules):
+            candidates.append(thread)
+        else:
+            rejected.append((thread, tdata))
+    print(f"{len(candidates)} of {len(threads)} threads qualify for a full fetch")
+
+    threads_data = await hydrate_threads(service, candidates, **FULL_FETCH_PARAMS)
+    eligible = [(thread, tdata) for thread, tdata in zip(candidates, threads_data) if tdata is not None]
+    return eligible, rejected
 
-                subject = await get_subject(tdata["messages"][0])
-                threads_with_messages.threads.append(
-                    Thread(thread_id=thread_id, subject=subject, messages=messages)
-                )
+async def build_thread(thread_id, tdata):
+    """Parses thread data into a Thread."""
+    messages = await asyncio.gather(*(process_message(message) for message in tdata["messages"]))
+    subject = await get_subject(tdata["messages"][0])
+    return Thread(thread_id=thread_id, subject=subject, messages=messages)
 
-        return {"threads_with_messages": threads_with_messages, "messages" : ["Email threads with messages retrieved, extracting meeting details..."]}
+async def process_thread_page(service, threads):
+    """
+    Turns one page of thread stubs into the Threads that qualify for extraction,
+    reusing unchanged threads from the local store and fetching the rest.
+
+    Returns:
+        tuple: Qualifying threads in the order of the page, and the stubs of threads that could not be fetched
+    """
+    cached = await thread_store.get_many(threads) if THREAD_STORE_ENABLED else {}
+    to_fetch = [thread for thread in threads if thread["id"] not in cached]
+    print(f"{len(cached)} threads unchanged in the local store, fetching {len(to_fetch)}")
+
+    # Get thread data for the remaining threads, a bounded number of API calls at a time
+    eligible, rejected = await screen_threads(service, to_fetch)
+    print("Thread data retrieved ")
+
+    fetched = {}
+    store_entries = [
+        (thread["id"], tdata["historyId"], NOT_QUALIFIED) for thread, tdata in rejected if "historyId" in tdata
+    ]
+    for thread, tdata in eligible:
+        fetched[thread["id"]] = await build_thread(thread["id"], tdata)
+        if "historyId" in tdata:
+            store_entries.append((thread["id"], tdata["historyId"], fetched[thread["id"]].model_dump_json()))
+
+    if THREAD_STORE_ENABLED:
+        await thread_store.put_many(store_entries)
+
+    # Keep the order of the listing, whichever source the thread came from
+    parsed_threads = []
+    for thread in threads:
+        if thread["id"] in cached:
+            payload = cached[thread["id"]]
+            parsed = Thread.model_validate_json(payload) if payload is not NOT_QUALIFIED else None
+        else:
+            parsed = fetched.get(thread["id"])
+        if parsed is not None:
+            parsed_threads.append(parsed)
+
+    screened = {thread["id"] for thread, _ in eligible + rejected}
+    failed = [thread for thread in to_fetch if thread["id"] not in screened]
+    return parsed_threads, failed
+
+async def single_page(threads):
+    if threads:
+        yield threads
+
+async def store_threads(threads):
+    """Stores parsed threads in the blob store, returning the references kept in the graph state."""
+    digests = await blob_store.put_many([thread.model_dump_json() for thread in threads])
+    return [ThreadRef(thread_id=thread.thread_id, digest=digest) for thread, digest in zip(threads, digests)]
+
+async def load_threads(thread_refs):
+    """Loads the threads referenced from the graph state, skipping the ones no longer stored."""
+    payloads = await blob_store.get_many([ref["digest"] for ref in thread_refs])
+    threads = []
+    for ref in thread_refs:
+        if ref["digest"] not in payloads:
+            print(f"Thread {ref['thread_id']} is no longer in the blob store, skipping it")
+            continue
+        threads.append(Thread.model_validate_json(payloads[ref["digest"]]))
+    return threads
+
+async def get_threads_with_messages(state: AgentState, config: RunnableConfig = None):
+    threads_with_messages = []
+    failed_threads = []
+    try:
+        service = (await account_services(config)).gmail
+        print("Getting threads")
+        if GMAIL_INCREMENTAL_SYNC:
+            # Listing errors propagate, so a failed full resync never moves the cursor
+            threads, account, history_id = await inbox_sync.changed_threads(
+                service, iter_thread_pages, label_id=next(iter(THREAD_QUERY.label_ids), None), max_threads=GMAIL_MAX_THREADS
+            )
+            pages = single_page(threads)
+        else:
+            pages = iter_thread_pages(service)
+
+        # Each page is hydrated as soon as it is listed, only the parsed threads are kept
+        async for page in pages:
+            print("Threads retrieved : ", len(page))
+            parsed_threads, failed = await process_thread_page(service, page)
+            threads_with_messages.extend(parsed_threads)
+            failed_threads.extend(failed)
+
+        # The cursor is committed once extraction succeeds, and kept where it is while threads failed to fetch
+        sync_cursor = None
+        if GMAIL_INCREMENTAL_SYNC and history_id is not None:
+            if failed_threads:
+                print(f"{len(failed_threads)} threads could not be fetched, keeping the sync cursor to retry them")
+            else:
+                sync_cursor = {"account": account, "history_id": history_id}
+
+        return {"thread_refs": await store_threads(threads_with_messages), "sync_cursor": sync_cursor, "messages" : ["Email threads with messages retrieved, extracting meeting details..."]}
     
     except HttpError as error:
         return {f"An error occurred: {error}"}
 
 
+def estimate_tokens(text):
+    """Rough token count of a text, about four characters per token."""
+    return len(text) // 4 + 1
+
+def chunk_threads(threads, token_budget=None):
+    """
+    Splits threads into chunks whose prompt size stays within token_budget.
+    A thread larger than the budget gets a chunk of its own.
+    """
+    token_budget = token_budget or EXTRACTION_CHUNK_TOKENS
+    chunks = []
+    current, current_tokens = [], 0
+    for thread in threads:
+        tokens = estimate_tokens(str(thread))
+        if current and current_tokens + tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(thread)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def extract_chunk(messages, semaphore):
+    async with semaphore:
+        return await llm_gateway.ainvoke(llm, messages, structured_output=MeetingDetailsList)
+
+def meeting_key(meeting):
+    """Identifies a meeting by its summary and its start and end instants."""
+    start = to_utc(meeting.start.dateTime, meeting.start.timeZone) or meeting.start.dateTime
+    end = to_utc(meeting.end.dateTime, meeting.end.timeZone) or meeting.end.dateTime
+    return (meeting.summary.strip().lower(), start, end)
+
+def merge_meeting_details(results):
+    """Merges the MeetingDetailsList of several chunks, combining the attendees of duplicate meetings."""
+    merged = {}
+    for result in results:
+        if result is None or result == "NONE" or result.meetings == "NONE":
+            continue
+        for meeting in result.meetings:
+            key = meeting_key(meeting)
+            if key not in merged:
+                merged[key] = meeting.model_copy(deep=True)
+            else:
+                attendees = merged[key].attendees
+                attendees.extend(email for email in meeting.attendees if email not in attendees)
+
+    if not merged:
+        return MeetingDetailsList(meetings="NONE")
+    return MeetingDetailsList(meetings=list(merged.values()))
+
+def upcoming_meetings(meetings, now):
+    """Keeps the meetings starting after now, meetings with an unreadable start are kept."""
+    upcoming = []
+    for meeting in meetings:
+        start = to_utc(meeting.start.dateTime, meeting.start.timeZone)
+        if start is None or start > now:
+            upcoming.append(meeting)
+    return upcoming
+
+def cache_chunk_result(chunk, result):
+    """
+    Stores the meetings extracted from a chunk under each thread's content hash.
+    Results whose meetings cannot be attributed to a thread of the chunk are not cached.
+    """
+    meetings = [] if result is None or result == "NONE" or result.meetings == "NONE" else result.meetings
+    thread_ids = {thread.thread_id for thread in chunk}
+    if len(chunk) == 1:
+        meetings = [meeting.model_copy(update={"thread_id": chunk[0].thread_id}) for meeting in meetings]
+    elif any(meeting.thread_id not in thread_ids for meeting in meetings):
+        return
+
+    for thread in chunk:
+        extraction_cache.put(
+            thread_content_hash(thread),
+            [meeting for meeting in meetings if meeting.thread_id == thread.thread_id]
+        )
+
 async def extract_meeting_details(state: AgentState):
 
     system_message = """
@@ -309,6 +742,9 @@ async def extract_meeting_details(state: AgentState):
     6. **Attendee Emails**:
     - Carefully extract attendee emails without any typos or errors,in the format:
        ["email1@example.com",  "email12@example.com"]
+
+    7. **Source Thread**:
+    - Set the thread ID of each meeting to the ID of the thread it was found in.
     
     ### Very Important:
     - Use the current date and time provided in the input to determine if the meeting is in the past or future.
@@ -324,17 +760,49 @@ async def extract_meeting_details(state: AgentState):
     Here is the current date and time:
     {current_date_time}
     """
-    threads_with_messages = state["threads_with_messages"]
-    threads_with_messages = threads_with_messages.threads
+    threads_with_messages = await load_threads(state["thread_refs"])
     current_date_time = datetime.now(timezone.utc).isoformat()
 
-    human_message = human_prompt.format(threads_with_messages=threads_with_messages, current_date_time=current_date_time)
-    messages = [SystemMessage(content=system_message), HumanMessage(content=human_message)]
+    # Only threads showing signs of scheduling are worth a model call
+    threads_with_messages, skipped_threads = prefilter_threads(threads_with_messages) if PREFILTER_ENABLED else (threads_with_messages, [])
+    print(f"Prefilter skipped {len(skipped_threads)} threads without scheduling signals")
+
+    # Reuse the meetings of threads whose content was already extracted
+    now = datetime.now(timezone.utc)
+    cached_results = []
+    uncached_threads = []
+    for thread in threads_with_messages:
+        cached = extraction_cache.get(thread_content_hash(thread))
+        if cached is None:
+            uncached_threads.append(thread)
+        else:
+            cached_results.append(MeetingDetailsList(meetings=upcoming_meetings(cached, now) or "NONE"))
+
+    # Map: one model call per token-budgeted chunk of threads, a bounded number at a time
+    chunks = chunk_threads(uncached_threads)
+    print(f"Extracting meeting details from {len(uncached_threads)} threads in {len(chunks)} chunks, {len(cached_results)} threads cached")
+    semaphore = asyncio.Semaphore(max(1, EXTRACTION_CONCURRENCY))
+    results = await asyncio.gather(*(
+        extract_chunk(
+            [SystemMessage(content=system_message), HumanMessage(content=human_prompt.format(threads_with_messages=chunk, current_date_time=current_date_time))],
+            semaphore
+        )
+        for chunk in chunks
+    ))
+
+    for chunk, result in zip(chunks, results):
+        cache_chunk_result(chunk, result)
+
+    # Reduce: merge the meetings of all chunks, dropping duplicates
+    meeting_details = merge_meeting_details(cached_results + list(results))
 
-    meeting_details = llm.with_structured_output(MeetingDetailsList).invoke(messages)
+    # Every fetched thread is processed, later runs can start from the new history
+    sync_cursor = state.get("sync_cursor")
+    if sync_cursor:
+        inbox_sync.commit(sync_cursor["account"], sync_cursor["history_id"])
 
-    if meeting_details == "NONE":
-        return {"messages" : ["No meeting details found in the email threads."]}
+    if meeting_details.meetings == "NONE":
+        return {"meeting_details" : meeting_details, "messages" : ["No meeting details found in the email threads."]}
     else:
         return {"meeting_details" : meeting_details, "messages" : ["Extracted meeting details from the email threads, creating meeting events to be scheduled..."]}
 
@@ -355,6 +823,23 @@ async def after_extract_meeting_details_router(state:AgentState):
         return "events_to_schedule"
     
 
+def meeting_event_id(meeting):
+    """
+    Derives a Calendar event id from the source thread, summary, start and end of a
+    formatted meeting, so the same meeting always maps to the same event.
+    The hex digest only uses characters Calendar allows in event ids.
+    """
+    thread_id = meeting.get("extendedProperties", {}).get("private", {}).get("threadId", "")
+    start = to_utc(meeting["start"]["dateTime"], meeting["start"].get("timeZone"))
+    end = to_utc(meeting["end"]["dateTime"], meeting["end"].get("timeZone"))
+    content = "|".join([
+        thread_id,
+        meeting.get("summary", "").strip().lower(),
+        start.isoformat() if start else meeting["start"]["dateTime"],
+        end.isoformat() if end else meeting["end"]["dateTime"],
+    ])
+    return hashlib.sha256(content.encode()).hexdigest()
+
 async def format_meeting_details(meeting_details):
     """
     Takes a result object containing meetings, formats them into JSON,
@@ -378,7 +863,14 @@ async def format_meeting_details(meeting_details):
     print("All scheduled meetings:")
     print("======================")
     for meeting in dict_output["meetings"]:
-        meeting["conferenceData"] = {"createRequest": {"requestId": "unique-request-id"}}
+        # Keep the source thread on the event instead of sending an unknown field to the Calendar API
+        thread_id = meeting.pop("thread_id", None)
+        if thread_id:
+            meeting["extendedProperties"] = {"private": {"threadId": thread_id}}
+
+        # Content-derived ids make inserting the same meeting twice a no-op
+        meeting["id"] = meeting_event_id(meeting)
+        meeting["conferenceData"] = {"createRequest": {"requestId": meeting["id"]}}
 
         if meeting["attendees"] is not None:
             meeting["attendees"] = [{"email" : email} for email in meeting["attendees"]]
@@ -406,6 +898,12 @@ async def events_to_schedule(state: AgentState):
 
 
 async def ensure_rfc3339(timestamp_str, timezone):
+    normalized = normalize_rfc3339(timestamp_str, timezone)
+    if normalized is not None:
+        return normalized
+
+    # Only timestamps the local parser does not understand go to the model
+    print(f"Could not parse timestamp {timestamp_str!r}, asking the model to convert it")
     system_message = """
     Parse the input timestamp and return it in RFC3339 format.
     If the timestamp is naive (i.e. has no timezone), assume UTC.
@@ -427,49 +925,123 @@ async def ensure_rfc3339(timestamp_str, timezone):
     """
     human_prompt = human_prompt.format(timestamp_str=timestamp_str, timezone=timezone)
     messages = [SystemMessage(content=system_message), HumanMessage(content=human_prompt)]
-    response = llm.invoke(messages)
+    response = await llm_gateway.ainvoke(llm, messages)
     return response.content
 
 
-async def fetch_conflicting_events_for_meeting(state: AgentState):
+async def list_events(calendar_service, calendar_id, time_min, time_max):
+    """Lists the events overlapping [time_min, time_max), following all result pages."""
+    events = []
+    page_token = None
+    while True:
+        events_result = await execute_request(calendar_service.events().list(
+            calendarId=calendar_id,
+            timeMin=time_min,
+            timeMax=time_max,
+            singleEvents=True,
+            orderBy="startTime",
+            maxResults=2500,
+            pageToken=page_token
+        ))
+        events.extend(events_result.get("items", []))
+        page_token = events_result.get("nextPageToken")
+        if not page_token:
+            return events
+
+async def load_calendar_events(calendar_service, user_id, calendar_id, time_min, time_max):
+    """Returns the events overlapping [time_min, time_max), from the account's calendar mirror when it covers the window."""
+    if CALENDAR_MIRROR_ENABLED:
+        start, end = to_utc(time_min), to_utc(time_max)
+        if start is not None and end is not None:
+            await calendar_mirror.sync(calendar_service, user_id, calendar_id)
+            if await calendar_mirror.covers(user_id, calendar_id, start, end):
+                return await calendar_mirror.events_between(user_id, calendar_id, start, end)
+    return await list_events(calendar_service, calendar_id, time_min, time_max)
+
+def window_key(time_min, time_max):
+    return f"{time_min}|{time_max}"
+
+async def revalidate_conflict(calendar_service, calendar_id, snapshot_event, start, end):
+    """
+    Checks a conflict seen before the interrupt with a conditional get on its etag.
+    Returns the event if it still overlaps [start, end), None if it is gone or moved away.
+    """
+    request = calendar_service.events().get(calendarId=calendar_id, eventId=snapshot_event["id"])
+    if snapshot_event.get("etag"):
+        request.headers["If-None-Match"] = snapshot_event["etag"]
+    try:
+        event = await execute_request(request)
+    except HttpError as error:
+        if error.resp.status == 304:
+            return {"id": snapshot_event["id"], "summary": snapshot_event.get("summary")}
+        if error.resp.status in (404, 410):
+            return None
+        raise
+
+    bounds = event_bounds(event)
+    if event.get("status") == "cancelled" or bounds is None or not (bounds[0] < end and bounds[1] > start):
+        return None
+    return event
+
+async def revalidate_conflicts(calendar_service, calendar_id, snapshot_events, time_min, time_max):
+    """Revalidates the snapshotted conflicts of a meeting window, returning the ones still in place."""
+    start, end = to_utc(time_min), to_utc(time_max)
+    events = await asyncio.gather(*(
+        revalidate_conflict(calendar_service, calendar_id, snapshot_event, start, end) for snapshot_event in snapshot_events
+    ))
+    return [event for event in events if event is not None]
+
+async def meeting_window(meeting_event):
+    """Returns the RFC3339 start and end of a meeting event."""
+    timezone = meeting_event["start"]["timeZone"]
+    time_min = await ensure_rfc3339(meeting_event["start"]["dateTime"], timezone)
+    time_max = await ensure_rfc3339(meeting_event["end"]["dateTime"], timezone)
+    return time_min, time_max
+
+async def fetch_conflicting_events_for_meeting(state: AgentState, config: RunnableConfig = None):
     """
     Fetch any existing calendar events that conflict with the given meeting_event.
+    All meetings are checked against a single events.list call spanning from the
+    earliest start to the latest end, indexed locally.
     """
-    global calendar_service
+    user_id = user_id_of(config)
+    calendar_service = (await account_services(config)).calendar
     calendar_id = "primary"
     conflicting_events = []
+    conflict_snapshot = {}
     bool_conflicting_events = False
-    for meeting_event in state["events_to_be_scheduled"]["meetings"]:
-         # Extract start and end times from the meeting event
-        time_min_raw = meeting_event["start"]["dateTime"]
-
-        time_max_raw = meeting_event["end"]["dateTime"]
-        timezone = meeting_event["start"]["timeZone"]
-
-        # Ensure the timestamps are RFC3339 compliant
-        time_min = await ensure_rfc3339(time_min_raw, timezone)
-        time_max = await ensure_rfc3339(time_max_raw, timezone)
+    meetings = state["events_to_be_scheduled"]["meetings"]
+
+    # Ensure the timestamps are RFC3339 compliant
+    windows = [await meeting_window(meeting_event) for meeting_event in meetings]
+    bounds = [(to_utc(time_min), to_utc(time_max)) for time_min, time_max in windows]
+    readable = [bound for bound in bounds if None not in bound]
+
+    # Query the calendar once for the whole span of the meetings
+    index = IntervalIndex([])
+    if readable:
+        span_min = min(start for start, _ in readable).isoformat()
+        span_max = max(end for _, end in readable).isoformat()
+        index = IntervalIndex.from_events(await load_calendar_events(calendar_service, user_id, calendar_id, span_min, span_max))
+        print(f"Indexed {len(index)} calendar events between {span_min} and {span_max}")
+
+    for meeting_event, (time_min, time_max), (start, end) in zip(meetings, windows, bounds):
+        if start is None or end is None:
+            # Times the index cannot compare are left to the Calendar API
+            events = await list_events(calendar_service, calendar_id, time_min, time_max)
+        else:
+            events = index.overlapping(start, end)
+        # The meeting's own event, created by an earlier run, never conflicts with it
+        own_id = meeting_event.get("id") or meeting_event_id(meeting_event)
+        events = [event for event in events if event.get("id") != own_id]
 
-        print(time_min, time_max)
-        type(time_min)
-        type(time_max)
-        
+        # Remember what was seen so scheduling can revalidate it instead of querying again
+        conflict_snapshot[window_key(time_min, time_max)] = [
+            {"id": event["id"], "etag": event.get("etag"), "summary": event.get("summary")} for event in events
+        ]
 
-        # Query the calendar for events in the specified time range
-        loop = asyncio.get_event_loop()
-        events_result = await loop.run_in_executor(
-            None, 
-            partial(calendar_service.events().list(
-                calendarId=calendar_id,
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy="startTime"
-            ).execute)
-        )
         existing_events = []
-        print(events_result)
-        for event in events_result.get("items", []):
+        for event in events:
             existing_event = {
                 "summary": event.get("summary", "No summary"),
                 "start": {
@@ -495,9 +1067,9 @@ async def fetch_conflicting_events_for_meeting(state: AgentState):
     
     
     if bool_conflicting_events == False:
-        return {"conflicting_events" : "NONE", "messages" : ["No conflicting events found, scheduling them..."], "events_to_be_scheduled" : state["events_to_be_scheduled"]}
+        return {"conflicting_events" : "NONE", "messages" : ["No conflicting events found, scheduling them..."], "conflict_snapshot" : conflict_snapshot}
     else:
-        return {"conflicting_events" : conflicting_events, "messages" : ["Found conflicting events, resolving them..."], "events_to_be_scheduled" : state["events_to_be_scheduled"]}
+        return {"conflicting_events" : conflicting_events, "messages" : ["Found conflicting events, resolving them..."], "conflict_snapshot" : conflict_snapshot}
 
 
 
@@ -546,7 +1118,7 @@ async def resolve_conflicting_events(state: AgentState):
         human_message = human_prompt.format(conflicting_events=conflicting_events, meeting_details=meeting_details, user_input=resolution_input)
 
         messages = [SystemMessage(content=system_message), HumanMessage(content=human_message)]
-        resolution = llm.with_structured_output(Resolution).invoke(messages)
+        resolution = await llm_gateway.ainvoke(llm, messages, structured_output=Resolution)
         resolved_events = resolution.resolved_events
         resolution_description = resolution.resolution_description
         formatted_resolved_events = await format_meeting_details(resolved_events)
@@ -555,87 +1127,187 @@ async def resolve_conflicting_events(state: AgentState):
 
     
 
-async def create_meeting_events(state: AgentState):
-    calendar_id = "primary"
+def group_overlapping_meetings(windows, conflicts):
+    """
+    Groups meetings that have to be committed one after another: meetings whose
+    windows overlap and meetings sharing a conflicting event.
+    Args:
+        windows: (start, end) UTC datetimes of each meeting, None when unreadable
+        conflicts: Conflicting events of each meeting
 
-    global calendar_service
-    
-    events_to_be_scheduled = state["events_to_be_scheduled"]
+    Returns:
+        list: Groups of meeting indexes, each in input order
+    """
+    parent = list(range(len(windows)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(first, second):
+        parent[find(second)] = find(first)
+
+    # Sweep the meetings by start, joining each one to the run of meetings it overlaps
+    run_owner, run_end = None, None
+    for index in sorted((i for i, window in enumerate(windows) if window is not None), key=lambda i: windows[i][0]):
+        start, end = windows[index]
+        if run_owner is not None and start < run_end:
+            union(run_owner, index)
+            run_end = max(run_end, end)
+        else:
+            run_owner, run_end = index, end
+
+    conflict_owner = {}
+    for index, events in enumerate(conflicts):
+        for event in events:
+            if event["id"] in conflict_owner:
+                union(conflict_owner[event["id"]], index)
+            else:
+                conflict_owner[event["id"]] = index
+
+    groups = {}
+    for index in range(len(windows)):
+        groups.setdefault(find(index), []).append(index)
+    return list(groups.values())
+
+async def find_conflicts(calendar_service, user_id, calendar_id, meeting_event, conflict_snapshot):
+    """Returns the RFC3339 window of a meeting and the events it conflicts with."""
+    time_min, time_max = await meeting_window(meeting_event)
+
+    # Reuse the conflicts found before the interrupt when the meeting kept its times,
+    # the calendar mirror already applies every change made since
+    snapshot_events = conflict_snapshot.get(window_key(time_min, time_max))
+    if snapshot_events is not None and not CALENDAR_MIRROR_ENABLED and to_utc(time_min) and to_utc(time_max):
+        conflicting_events = await revalidate_conflicts(calendar_service, calendar_id, snapshot_events, time_min, time_max)
+    else:
+        conflicting_events = await load_calendar_events(calendar_service, user_id, calendar_id, time_min, time_max)
+    # Deleting the meeting's own event would cancel it for every attendee
+    own_id = meeting_event.get("id") or meeting_event_id(meeting_event)
+    conflicting_events = [event for event in conflicting_events if event.get("id") != own_id]
+    return (time_min, time_max), conflicting_events
+
+async def delete_conflict(calendar_service, user_id, calendar_id, conflict):
+    event_id = conflict["id"]
+    try:
+        await execute_request(calendar_service.events().delete(calendarId=calendar_id, eventId=event_id))
+    except HttpError as error:
+        # Already removed, which is what we wanted
+        if error.resp.status not in (404, 410):
+            raise
+    if CALENDAR_MIRROR_ENABLED:
+        await calendar_mirror.delete_event(user_id, calendar_id, event_id)
+    print(f"Deleted conflicting event: {conflict.get('summary', event_id)}")
+
+async def insert_event(calendar_service, calendar_id, meeting_event):
+    """Inserts a meeting's event, returning the existing event when one with the same id was created before."""
+    try:
+        return await execute_request(calendar_service.events().insert(
+            calendarId=calendar_id,
+            body=meeting_event,
+            conferenceDataVersion=1,
+            sendUpdates="all"
+        ))
+    except HttpError as error:
+        if error.resp.status != 409:
+            raise
+    existing_event = await execute_request(calendar_service.events().get(calendarId=calendar_id, eventId=meeting_event["id"]))
+    if existing_event.get("status") == "cancelled":
+        raise ValueError(f"Meeting '{meeting_event.get('summary')}' was scheduled before and has since been deleted")
+    print(f"Meeting '{meeting_event.get('summary')}' already exists in the calendar")
+    return existing_event
+
+async def commit_meeting(calendar_service, user_id, calendar_id, meeting_event, conflicting_events, deleted_ids):
+    """Deletes the conflicts of a meeting not deleted yet, then creates its event, unless it was committed before."""
+    if "id" not in meeting_event:
+        meeting_event = {**meeting_event, "id": meeting_event_id(meeting_event)}
+    committed = await meeting_ledger.get(user_id, calendar_id, meeting_event["id"])
+    if committed is not None:
+        print(f"Meeting '{meeting_event.get('summary', 'Unnamed Meeting')}' was already scheduled, skipping it")
+        return committed
+
+    pending = [conflict for conflict in conflicting_events if conflict["id"] not in deleted_ids]
+    if pending:
+        print(f"Found {len(pending)} conflicting event(s) for meeting '{meeting_event.get('summary', 'Unnamed Meeting')}':")
+        await asyncio.gather(*(delete_conflict(calendar_service, user_id, calendar_id, conflict) for conflict in pending))
+        deleted_ids.update(conflict["id"] for conflict in pending)
+    else:
+        print(f"No conflicts for meeting '{meeting_event.get('summary', 'Unnamed Meeting')}'.")
+
+    # --- Create the new event ---
+    created_event = await insert_event(calendar_service, calendar_id, meeting_event)
+    if CALENDAR_MIRROR_ENABLED:
+        await calendar_mirror.upsert_event(user_id, calendar_id, created_event)
+
+    event_scheduled = {
+        "summary": created_event['summary'],
+        "event_link": created_event.get('htmlLink'),
+        "meeting_link": created_event['hangoutLink'],
+        "start": created_event['start']['dateTime'],
+        "end": created_event['end']['dateTime'],
+        "timezone": created_event['start']['timeZone'],
+        "location": created_event['location'],
+        "description": created_event['description'],
+        "attendees": [", ".join([attendee['email'] for attendee in created_event['attendees']])],
+        "created_at": created_event['created'],
+        "updated_at": created_event['updated']
+    }
+    await meeting_ledger.record(user_id, calendar_id, meeting_event["id"], event_scheduled)
+    print(event_scheduled)
+    print("--------------------------------")
+    return event_scheduled
 
-    meetings_scheduled = []
-    for meeting_event in events_to_be_scheduled["meetings"]:
-        # --- Check for and delete conflicting events ---
-        time_min = meeting_event["start"]["dateTime"]
-        time_max = meeting_event["end"]["dateTime"]
-        timezone = meeting_event["start"]["timeZone"]
-
-        time_min = await ensure_rfc3339(time_min, timezone)
-        time_max = await ensure_rfc3339(time_max, timezone)
-
-        # Fetch conflicting events within the meeting's time range
-        loop = asyncio.get_event_loop()
-        events_result = await loop.run_in_executor(
-            None, 
-            partial(calendar_service.events().list(
-                calendarId=calendar_id,
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy="startTime"
-            ).execute)
-        )
+async def create_meeting_events(state: AgentState, config: RunnableConfig = None):
+    """
+    Deletes the conflicts of every meeting and creates its event.
+    Conflicts are looked up for all meetings before anything is written, so new
+    meetings never remove each other. Independent meetings are committed
+    concurrently, up to CALENDAR_WRITE_CONCURRENCY at a time, while meetings that
+    overlap or share a conflict are committed one after another in input order.
+    """
+    calendar_id = "primary"
+    user_id = user_id_of(config)
+    calendar_service = (await account_services(config)).calendar
 
-        conflicting_events = events_result.get("items", [])
-        if conflicting_events:
-            print(f"Found {len(conflicting_events)} conflicting event(s) for meeting '{meeting_event.get('summary', 'Unnamed Meeting')}':")
-            for conflict in conflicting_events:
-                event_id = conflict["id"]
-                conflict_summary = conflict.get("summary", event_id)
-                # Delete the conflicting event
-                loop = asyncio.get_event_loop()
-                await loop.run_in_executor(
-                    None, 
-                    partial(calendar_service.events().delete(
-                        calendarId=calendar_id, 
-                        eventId=event_id).execute)
-                )
-                print(f"Deleted conflicting event: {conflict_summary}")
-            print("--------------------------------")
-        else:
-            print(f"No conflicts for meeting '{meeting_event.get('summary', 'Unnamed Meeting')}'.")
-            print("--------------------------------")
-
-        # --- Create the new event ---
-        loop = asyncio.get_event_loop()
-        created_event = await loop.run_in_executor(
-            None, 
-            partial(calendar_service.events().insert(
-                calendarId=calendar_id,
-                body=meeting_event,
-                conferenceDataVersion=1,
-                sendUpdates="all"
-            ).execute)
-        )
+    events_to_be_scheduled = state["events_to_be_scheduled"]
+    conflict_snapshot = state.get("conflict_snapshot") or {}
+    meetings = events_to_be_scheduled["meetings"]
+    semaphore = asyncio.Semaphore(max(1, CALENDAR_WRITE_CONCURRENCY))
+
+    # --- Check for conflicting events of all meetings ---
+    async def bounded_find_conflicts(meeting_event):
+        async with semaphore:
+            return await find_conflicts(calendar_service, user_id, calendar_id, meeting_event, conflict_snapshot)
+
+    lookups = await asyncio.gather(*(bounded_find_conflicts(meeting_event) for meeting_event in meetings))
+    windows = []
+    for (time_min, time_max), _ in lookups:
+        start, end = to_utc(time_min), to_utc(time_max)
+        windows.append((start, end) if start is not None and end is not None else None)
+
+    # --- Delete conflicts and create events, group by group ---
+    results = [None] * len(meetings)
+
+    async def commit_group(group):
+        deleted_ids = set()
+        async with semaphore:
+            for index in group:
+                try:
+                    results[index] = await commit_meeting(calendar_service, user_id, calendar_id, meetings[index], lookups[index][1], deleted_ids)
+                except Exception as error:
+                    print(f"An error occurred scheduling meeting '{meetings[index].get('summary', 'Unnamed Meeting')}': {error}")
+                    results[index] = {"summary": meetings[index].get("summary", "Unnamed Meeting"), "error": str(error)}
 
+    await asyncio.gather(*(commit_group(group) for group in group_overlapping_meetings(windows, [events for _, events in lookups])))
 
-        event_scheduled = {
-            "summary": created_event['summary'],
-            "event_link": created_event.get('htmlLink'),
-            "meeting_link": created_event['hangoutLink'],
-            "start": created_event['start']['dateTime'],
-            "end": created_event['end']['dateTime'],
-            "timezone": created_event['start']['timeZone'],
-            "location": created_event['location'],
-            "description": created_event['description'],
-            "attendees": [", ".join([attendee['email'] for attendee in created_event['attendees']])],
-            "created_at": created_event['created'],
-            "updated_at": created_event['updated']
-        }
-        print(event_scheduled)
-        meetings_scheduled.append(event_scheduled)
+    meetings_scheduled = [result for result in results if "error" not in result]
+    meetings_failed = [result for result in results if "error" in result]
 
-    
-    return {"meetings_scheduled" : meetings_scheduled, "messages" : ["Created meeting events in the calendar and sent notifications to the attendees!"]}
+    message = "Created meeting events in the calendar and sent notifications to the attendees!"
+    if meetings_failed:
+        message = f"Created {len(meetings_scheduled)} meeting events in the calendar, {len(meetings_failed)} could not be scheduled."
+    return {"meetings_scheduled" : meetings_scheduled, "meetings_failed" : meetings_failed, "messages" : [message]}
 
 
 async def no_meeting_details(state: AgentState):
@@ -665,8 +1337,8 @@ builder.add_edge("create_meeting_events", END)
 builder.add_edge("no_meeting_details", END)
 
 
-async def get_email_agent():
-    memory = await get_memory()
+async def get_email_agent(backend=None):
+    memory = await get_memory(backend)
     return builder.compile(checkpointer=memory, interrupt_before=["resolve_conflicting_events"])
 
 # Export the get_email_agent function
@@ -0,0 +1,50 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+
+
+EXTRACTION_CACHE_TTL_SECONDS = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "1000"))
+
+
+def thread_content_hash(thread):
+    """Hashes a thread's id with the ids and bodies of its messages, changing whenever the thread does."""
+    digest = hashlib.sha256(thread.thread_id.encode())
+    for message in thread.messages:
+        digest.update(b"\0" + message["msg_id"].encode())
+        digest.update(b"\0" + (message["msg_body"] or "").encode())
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    In-memory LRU cache of the meetings extracted from a thread, keyed by the
+    thread's content hash. Entries expire ttl_seconds after they were stored.
+    """
+
+    def __init__(self, max_entries=EXTRACTION_CACHE_MAX_ENTRIES, ttl_seconds=EXTRACTION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """Returns the cached meetings for key, None when missing or expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, meetings = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return meetings
+
+    def put(self, key, meetings):
+        self.entries[key] = (time.time(), meetings)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,62 @@
+import os
+from pydantic import BaseModel, Field
+from typing import List, Dict
+
+
+def _env_list(var, default=""):
+    return [item.strip() for item in os.getenv(var, default).split(",") if item.strip()]
+
+
+def _quote(term):
+    return f'"{term}"' if " " in term else term
+
+
+def _any_of(terms):
+    terms = [_quote(term) for term in terms]
+    return terms[0] if len(terms) == 1 else "(" + " OR ".join(terms) + ")"
+
+
+class ThreadQuery(BaseModel):
+    """Selection of inbox threads, compiled into threads.list parameters so Gmail does the filtering."""
+    label_ids: List[str] = Field(default_factory=list, description="Only threads with all of these label ids, e.g. INBOX")
+    exclude_categories: List[str] = Field(default_factory=list, description="Inbox categories to skip, e.g. promotions, social")
+    newer_than: str = Field(default="", description="Relative age such as 7d, 2m or 1y")
+    allow_senders: List[str] = Field(default_factory=list, description="Only threads from these addresses or domains")
+    deny_senders: List[str] = Field(default_factory=list, description="Skip threads from these addresses or domains")
+    keywords: List[str] = Field(default_factory=list, description="Only threads mentioning at least one of these words")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            label_ids=_env_list("GMAIL_QUERY_LABEL_IDS"),
+            exclude_categories=_env_list("GMAIL_QUERY_EXCLUDE_CATEGORIES"),
+            newer_than=os.getenv("GMAIL_NEWER_THAN", ""),
+            allow_senders=_env_list("GMAIL_QUERY_ALLOW_SENDERS"),
+            deny_senders=_env_list("GMAIL_QUERY_DENY_SENDERS"),
+            keywords=_env_list("GMAIL_QUERY_KEYWORDS"),
+        )
+
+    def to_q(self) -> str:
+        """Compiles the filters into a Gmail search string."""
+        terms = []
+        if self.newer_than:
+            terms.append(f"newer_than:{self.newer_than}")
+        for category in self.exclude_categories:
+            terms.append(f"-category:{category}")
+        if self.allow_senders:
+            terms.append(f"from:{_any_of(self.allow_senders)}")
+        if self.deny_senders:
+            terms.append(f"-from:{_any_of(self.deny_senders)}")
+        if self.keywords:
+            terms.append(_any_of(self.keywords))
+        return " ".join(terms)
+
+    def compile(self) -> Dict:
+        """Returns the q and labelIds parameters of threads.list for this query."""
+        params = {}
+        q = self.to_q()
+        if q:
+            params["q"] = q
+        if self.label_ids:
+            params["labelIds"] = list(self.label_ids)
+        return params
@@ -0,0 +1,338 @@
+import os
+import json
+import asyncio
+import random
+import threading
+import weakref
+import httplib2
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+from app.rate_limit import TokenBucket
+
+
+# Gmail accepts at most 100 calls per batch request
+BATCH_REQUEST_LIMIT = 100
+
+# Optional directory of <service>.<version>.json discovery documents, used before the ones shipped with googleapiclient
+GOOGLE_DISCOVERY_DIR = os.getenv("GOOGLE_DISCOVERY_DIR", "")
+
+# APIs whose clients this server builds
+DISCOVERY_APIS = [("gmail", "v1"), ("calendar", "v3")]
+
+# Threads executing Gmail and Calendar calls, each with its own keep-alive connections
+GOOGLE_IO_WORKERS = int(os.getenv("GOOGLE_IO_WORKERS", "32"))
+
+# Statuses worth retrying, for single requests and sub-requests of a batch
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Reasons of 403 errors that only mean "slow down"
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Quota units charged per call, other methods cost DEFAULT_QUOTA_COST
+METHOD_QUOTA_COSTS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.labels.list": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.list": 5,
+    "gmail.users.threads.get": 10,
+    "gmail.users.threads.list": 10,
+}
+DEFAULT_QUOTA_COST = 1
+
+# Quota units per second allowed per user and per project, for each API
+GOOGLE_QUOTA_LIMITS = {
+    "gmail": (
+        float(os.getenv("GMAIL_USER_QUOTA_PER_SECOND", "250")),
+        float(os.getenv("GMAIL_PROJECT_QUOTA_PER_SECOND", "20000"))
+    ),
+    "calendar": (
+        float(os.getenv("CALENDAR_USER_QUOTA_PER_SECOND", "10")),
+        float(os.getenv("CALENDAR_PROJECT_QUOTA_PER_SECOND", "160"))
+    ),
+}
+GOOGLE_MAX_RETRIES = int(os.getenv("GOOGLE_MAX_RETRIES", "4"))
+
+# Statuses returned when a batch as a whole is rejected for being too large
+BATCH_TOO_LARGE_STATUSES = {400, 413}
+
+
+@lru_cache(maxsize=None)
+def discovery_document(service_name, version):
+    """
+    Returns the parsed discovery document of an API, read from GOOGLE_DISCOVERY_DIR
+    or the static documents shipped with googleapiclient, None if neither has it.
+    The document is parsed once per process and shared by every client built from it.
+    """
+    content = None
+    if GOOGLE_DISCOVERY_DIR:
+        try:
+            with open(os.path.join(GOOGLE_DISCOVERY_DIR, f"{service_name}.{version}.json")) as f:
+                content = f.read()
+        except FileNotFoundError:
+            pass
+    content = content or get_static_doc(service_name, version)
+    return json.loads(content) if content else None
+
+
+def build_service(service_name, version, credentials):
+    """Builds an API client from the cached discovery document, fetching the document only when none is available locally."""
+    document = discovery_document(service_name, version)
+    if document is None:
+        return build(service_name, version, credentials=credentials)
+    return build_from_document(document, credentials=credentials)
+
+
+def warm_discovery_documents():
+    """Loads the discovery documents of every API the server uses, so the first session does not pay for parsing them."""
+    for service_name, version in DISCOVERY_APIS:
+        discovery_document(service_name, version)
+
+
+class GoogleIOPool:
+    """
+    Dedicated thread pool for Google API calls.
+
+    httplib2 transports are not thread-safe, so a request is never executed on the
+    transport of its client. It runs on a transport owned by the worker thread, built
+    once per thread and credentials and reused for keep-alive connections.
+    Tracks how many calls wait for a worker and how many are running.
+    """
+
+    def __init__(self, max_workers=GOOGLE_IO_WORKERS):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="google-io")
+        self.local = threading.local()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def thread_http(self, http):
+        """Returns the calling thread's own transport for the credentials of the given one."""
+        if not isinstance(http, AuthorizedHttp):
+            # Clients without credentials get a plain transport of the thread
+            if not isinstance(http, httplib2.Http):
+                return None
+            if getattr(self.local, "http", None) is None:
+                self.local.http = build_http()
+            return self.local.http
+        transports = getattr(self.local, "transports", None)
+        if transports is None:
+            transports = self.local.transports = weakref.WeakKeyDictionary()
+        if http.credentials not in transports:
+            transports[http.credentials] = AuthorizedHttp(http.credentials, http=build_http())
+        return transports[http.credentials]
+
+    def _execute(self, request, http):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            thread_http = self.thread_http(http)
+            return request.execute(http=thread_http) if thread_http is not None else request.execute()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, request, http=None):
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self._execute, request, http)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+            }
+
+
+google_io_pool = GoogleIOPool()
+
+
+def is_retryable_error(exception):
+    """Rate limits (429, or 403 rateLimitExceeded) and server errors are worth another attempt."""
+    if not isinstance(exception, HttpError):
+        return False
+    status = exception.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    details = exception.error_details if isinstance(exception.error_details, list) else []
+    return status == 403 and any(isinstance(detail, dict) and detail.get("reason") in RATE_LIMIT_REASONS for detail in details)
+
+
+def _sub_requests(request):
+    """Returns the requests of a batch request, or the request itself."""
+    sub_requests = getattr(request, "_requests", None)
+    return list(sub_requests.values()) if isinstance(sub_requests, dict) else [request]
+
+
+def _method_id(request):
+    method_id = getattr(request, "methodId", None)
+    return method_id if isinstance(method_id, str) else None
+
+
+def quota_cost(request):
+    """Returns the quota units a request, or all requests of a batch, are charged."""
+    return sum(METHOD_QUOTA_COSTS.get(_method_id(sub_request), DEFAULT_QUOTA_COST) for sub_request in _sub_requests(request))
+
+
+def quota_api(request):
+    """Returns the API a request belongs to, "gmail" or "calendar", None when it cannot be told."""
+    method_ids = [_method_id(sub_request) for sub_request in _sub_requests(request)]
+    return method_ids[0].split(".")[0] if method_ids and method_ids[0] else None
+
+
+class QuotaScheduler:
+    """
+    Client-side admission for Google API calls.
+
+    Every call takes its quota units from a token bucket of its user, identified
+    by the credentials of its transport, and one of the project, per API, before
+    it is sent. Calls rejected with 429, 403 rateLimitExceeded or a server error
+    are retried with jittered exponential backoff. Calls of APIs without known
+    limits are only retried.
+    """
+
+    def __init__(self, limits=None, max_retries=GOOGLE_MAX_RETRIES, base_delay=1.0, max_delay=32.0):
+        self.limits = GOOGLE_QUOTA_LIMITS if limits is None else limits
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.project_buckets = {}
+        self.user_buckets = weakref.WeakKeyDictionary()
+        self.anonymous_buckets = {}
+
+    def _buckets(self, api, credentials):
+        if api not in self.limits:
+            return []
+        user_rate, project_rate = self.limits[api]
+        if api not in self.project_buckets:
+            self.project_buckets[api] = TokenBucket(project_rate)
+        user_buckets = self.anonymous_buckets if credentials is None else self.user_buckets.setdefault(credentials, {})
+        if api not in user_buckets:
+            user_buckets[api] = TokenBucket(user_rate)
+        return [user_buckets[api], self.project_buckets[api]]
+
+    async def run(self, request, http, call):
+        """
+        Runs a call once its quota is available, retrying it while it is rate limited or fails on the server.
+        Args:
+            request: The request or batch request the call sends, used to price it
+            http: Transport of the client the request was built from
+            call: Coroutine function sending the request
+        """
+        api = quota_api(request)
+        cost = quota_cost(request)
+        buckets = self._buckets(api, getattr(http, "credentials", None))
+        for attempt in range(self.max_retries + 1):
+            for bucket in buckets:
+                await bucket.acquire(cost)
+            try:
+                return await call()
+            except HttpError as error:
+                if attempt == self.max_retries or not is_retryable_error(error):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"{_method_id(request) or 'Google API call'} failed with {error.resp.status}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+quota_scheduler = QuotaScheduler()
+
+
+async def execute_request(request, http=None):
+    """
+    Executes a googleapiclient request on the Google I/O pool, within quota, and returns the response.
+    Args:
+        request: The request, or batch request, to execute
+        http: Transport of the client the request was built from, defaults to request.http
+    """
+    http = http if http is not None else getattr(request, "http", None)
+    return await quota_scheduler.run(request, http, lambda: google_io_pool.run(request, http))
+
+
+async def _execute_batch_chunk(service, requests):
+    """
+    Sends the given requests as one batch, splitting it in half whenever the
+    API rejects the batch as too large.
+    Args:
+        service: Authorized API service instance the requests were built from
+        requests: Dictionary of request id to request
+
+    Returns:
+        dict: Request id to a (response, exception) tuple
+    """
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    batch = service.new_batch_http_request(callback=callback)
+    for request_id, request in requests.items():
+        batch.add(request, request_id=request_id)
+
+    try:
+        # The batch is sent with the transport of the client its requests come from
+        await execute_request(batch, http=getattr(next(iter(requests.values())), "http", None))
+    except HttpError as error:
+        if error.resp.status not in BATCH_TOO_LARGE_STATUSES or len(requests) == 1:
+            raise
+        print(f"Batch of {len(requests)} requests rejected ({error.resp.status}), splitting it")
+        items = list(requests.items())
+        middle = len(items) // 2
+        results = await _execute_batch_chunk(service, dict(items[:middle]))
+        results.update(await _execute_batch_chunk(service, dict(items[middle:])))
+
+    return results
+
+
+async def execute_batch(service, requests, batch_size=BATCH_REQUEST_LIMIT, max_attempts=3, retry_delay=1.0):
+    """
+    Executes requests through batch HTTP requests of at most batch_size calls each.
+    Sub-requests failing with a retryable status are retried in a new batch,
+    the ones that succeeded are not sent again.
+    Args:
+        service: Authorized API service instance the requests were built from
+        requests: List of requests to execute
+        batch_size: Maximum number of requests per batch
+        max_attempts: Maximum number of times a single request is sent
+        retry_delay: Base delay in seconds before retrying failed requests
+
+    Returns:
+        list: The response for each request in input order, or the exception it failed with
+    """
+    batch_size = max(1, min(batch_size, BATCH_REQUEST_LIMIT))
+    pending = {str(index): request for index, request in enumerate(requests)}
+    results = {}
+
+    for attempt in range(max_attempts):
+        failed = {}
+        items = list(pending.items())
+        for start in range(0, len(items), batch_size):
+            chunk_results = await _execute_batch_chunk(service, dict(items[start:start + batch_size]))
+            for request_id, (response, exception) in chunk_results.items():
+                if exception is None:
+                    results[request_id] = response
+                elif is_retryable_error(exception) and attempt < max_attempts - 1:
+                    failed[request_id] = pending[request_id]
+                else:
+                    results[request_id] = exception
+
+        if not failed:
+            break
+        print(f"Retrying {len(failed)} failed batch sub-requests")
+        pending = failed
+        await asyncio.sleep(retry_delay * 2 ** attempt)
+
+    return [results[str(index)] for index in range(len(requests))]
@@ -0,0 +1,186 @@
+import json
+import os
+import tempfile
+from googleapiclient.errors import HttpError
+from app.google_api import execute_request
+
+
+SYNC_STATE_PATH = os.getenv("GMAIL_SYNC_STATE_PATH", "gmail_sync_state.json")
+
+# Labels of messages that never count as an inbox change
+IGNORED_LABELS = {"SPAM", "TRASH", "DRAFT"}
+
+# Most threads listed while looking for the changed ones the thread query selects
+SYNC_SCAN_LIMIT = int(os.getenv("GMAIL_SYNC_SCAN_THREADS", "500"))
+
+
+class HistoryExpired(Exception):
+    """Raised when the stored historyId is too old for the history API to answer."""
+
+
+class SyncCursorStore:
+    """Persists the last synced Gmail historyId per account in a JSON file."""
+
+    def __init__(self, path=SYNC_STATE_PATH):
+        self.path = path
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading sync state: {e}")
+            return {}
+
+    def get(self, account):
+        return self._load().get(account)
+
+    def set(self, account, history_id):
+        state = self._load()
+        state[account] = str(history_id)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sync_state")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+async def get_profile(service):
+    """Returns the Gmail profile, containing the account's emailAddress and current historyId."""
+    return await execute_request(service.users().getProfile(userId="me"))
+
+
+async def list_changed_thread_ids(service, start_history_id, label_id=None):
+    """
+    Lists the threads that received new messages since start_history_id.
+    Args:
+        service: Authorized Gmail API service instance
+        start_history_id: historyId stored by the previous sync
+        label_id: Only count messages carrying this label, e.g. INBOX
+
+    Returns:
+        tuple: Changed thread ids, newest first, and the mailbox's latest historyId
+    """
+    thread_ids = []
+    history_id = start_history_id
+    page_token = None
+    while True:
+        params = {"userId": "me", "startHistoryId": start_history_id, "historyTypes": ["messageAdded"], "pageToken": page_token}
+        if label_id:
+            params["labelId"] = label_id
+        try:
+            response = await execute_request(service.users().history().list(**params))
+        except HttpError as error:
+            if error.resp.status == 404:
+                raise HistoryExpired(start_history_id) from error
+            raise
+
+        for record in response.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message = added["message"]
+                if IGNORED_LABELS.intersection(message.get("labelIds", [])):
+                    continue
+                thread_ids.append(message["threadId"])
+
+        history_id = response.get("historyId", history_id)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+    # History records are oldest first, threads.list returns newest first
+    changed = list(dict.fromkeys(reversed(thread_ids)))
+    return changed, history_id
+
+
+def unchanged_since(thread, history_id):
+    """Checks whether a listed thread has no history after history_id."""
+    return thread.get("historyId") is not None and int(thread["historyId"]) <= int(history_id)
+
+
+class InboxSync:
+    """
+    Incremental inbox sync based on Gmail's historyId.
+
+    The first run for an account, or a run whose cursor has expired, falls back
+    to a full listing. Later runs only return threads with new messages that the
+    listing would also select, at most max_threads of them.
+    """
+
+    def __init__(self, store=None, scan_limit=SYNC_SCAN_LIMIT):
+        self.store = store or SyncCursorStore()
+        self.scan_limit = scan_limit
+
+    async def changed_threads(self, service, list_pages, label_id=None, max_threads=None):
+        """
+        Args:
+            service: Authorized Gmail API service instance
+            list_pages: Async generator function yielding pages of thread stubs, newest first,
+                taking a max_threads option
+            label_id: Only count new messages carrying this label
+            max_threads: Maximum number of changed threads returned
+
+        Returns:
+            tuple: Thread stubs to hydrate, the account and the historyId to commit once they are
+            processed, None when some changed threads could not be told selected or excluded
+        """
+        profile = await get_profile(service)
+        account = profile["emailAddress"]
+        cursor = self.store.get(account)
+
+        if cursor is not None:
+            try:
+                thread_ids, history_id = await list_changed_thread_ids(service, cursor, label_id)
+                print(f"Incremental sync found {len(thread_ids)} changed threads since history {cursor}")
+                selected, resolved = await self._select(service, list_pages, thread_ids, cursor, max_threads)
+                return selected, account, history_id if resolved else None
+            except HistoryExpired:
+                print(f"History {cursor} expired, running a full resync")
+
+        threads = [thread async for page in list_pages(service) for thread in page]
+        return threads, account, profile["historyId"]
+
+    async def _select(self, service, list_pages, thread_ids, cursor, max_threads):
+        """
+        Keeps the changed threads the listing selects, in listing order. Threads the listing
+        ranks first are not necessarily changed ones (a reply only adds a SENT message), so
+        pages are read until every changed thread was seen, the listing ends, or it reaches a
+        thread unchanged since the cursor: threads below it are older, so the changed threads
+        not seen by then are excluded by the query.
+
+        Returns:
+            tuple: The selected thread stubs, at most max_threads of them, and whether every
+            changed thread was either selected or excluded
+        """
+        if not thread_ids:
+            return [], True
+        remaining = set(thread_ids)
+        selected = []
+        listed = 0
+        resolved = False
+        async for page in list_pages(service, max_threads=self.scan_limit):
+            listed += len(page)
+            for thread in page:
+                if thread["id"] in remaining:
+                    remaining.discard(thread["id"])
+                    selected.append(thread)
+            if not remaining or unchanged_since(page[-1], cursor):
+                resolved = True
+                break
+        else:
+            # The listing ended before the scan limit, changed threads missing from it are excluded
+            resolved = listed < self.scan_limit
+
+        print(f"{len(selected)} changed threads match the thread query")
+        if not resolved:
+            print(f"{len(remaining)} changed threads were not found within {self.scan_limit} listed threads, keeping the sync cursor")
+        # Like a full listing, only the newest max_threads threads are processed
+        return selected[:max_threads] if max_threads else selected, resolved
+
+    def commit(self, account, history_id):
+        self.store.set(account, history_id)
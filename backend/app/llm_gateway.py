@@ -0,0 +1,79 @@
+import os
+import random
+import asyncio
+import openai
+import anthropic
+from langchain_anthropic import ChatAnthropic
+from app.rate_limit import TokenBucket
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+
+def _provider_setting(name, provider, default):
+    return float(os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default)))
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, rate limits and server errors are worth another attempt."""
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError, anthropic.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def provider_of(model):
+    return "anthropic" if isinstance(model, ChatAnthropic) else "openai"
+
+
+class LLMGateway:
+    """
+    Shared entry point for model calls from async nodes.
+
+    Every call goes through ainvoke, so the event loop is never blocked, and is
+    limited per provider by a concurrency cap and a token-bucket rate limit.
+    Calls time out after timeout seconds and are retried with jittered
+    exponential backoff on timeouts, connection errors, 429 and 5xx.
+    Limits are read from LLM_CONCURRENCY, LLM_RATE_PER_SECOND, LLM_MAX_RETRIES and
+    LLM_TIMEOUT_SECONDS, each overridable per provider with an _OPENAI or _ANTHROPIC suffix.
+    """
+
+    def __init__(self, max_retries=None, timeout=None, base_delay=1.0, max_delay=30.0):
+        self.max_retries = int(max_retries if max_retries is not None else os.getenv("LLM_MAX_RETRIES", "3"))
+        self.timeout = float(timeout if timeout is not None else os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.semaphores = {}
+        self.buckets = {}
+
+    def _limits(self, provider):
+        if provider not in self.semaphores:
+            self.semaphores[provider] = asyncio.Semaphore(int(_provider_setting("LLM_CONCURRENCY", provider, "8")))
+            self.buckets[provider] = TokenBucket(_provider_setting("LLM_RATE_PER_SECOND", provider, "5"))
+        return self.semaphores[provider], self.buckets[provider]
+
+    async def ainvoke(self, model, messages, structured_output=None):
+        """
+        Invokes a chat model asynchronously.
+        Args:
+            model: The chat model to call
+            messages: The messages to send
+            structured_output: Optional schema passed to with_structured_output
+
+        Returns:
+            The model response, or the parsed structured output
+        """
+        provider = provider_of(model)
+        runnable = model.with_structured_output(structured_output) if structured_output is not None else model
+        semaphore, bucket = self._limits(provider)
+
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await bucket.acquire()
+                try:
+                    return await asyncio.wait_for(runnable.ainvoke(messages), self.timeout)
+                except Exception as error:
+                    if attempt == self.max_retries or not is_retryable(error):
+                        raise
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    print(f"{provider} call failed ({error!r}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
@@ -1,23 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
 import uuid
 import json
-from app.email_agent import get_email_agent
+from app.email_agent import get_email_agent, prewarm_services, token_manager, DEFAULT_USER_ID
+from app.api_auth import authenticated_user_id
+from app.session_manager import SessionManager
+from app.google_api import warm_discovery_documents, google_io_pool
 import asyncio
 
 app = FastAPI()
 
 # Store the email agent instance
 email_agent = None
+session_manager = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the email agent when the application starts"""
-    global email_agent
+    """Initialize the email agent and start sweeping abandoned sessions when the application starts"""
+    global email_agent, session_manager
+    # Parse the Gmail and Calendar discovery documents before the first session needs them
+    warm_discovery_documents()
+    await prewarm_services()
+    token_manager.start()
     email_agent = await get_email_agent()
+    session_manager = SessionManager(email_agent.checkpointer)
+    await session_manager.setup()
+    session_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await token_manager.stop()
+    if session_manager is not None:
+        await session_manager.stop()
 
 # Configure CORS
 app.add_middleware(
@@ -37,10 +54,29 @@ def format_message(message):
         return message.content
     return str(message)
 
+async def touch_session(config):
+    """Records a session before its run starts, so the sweeper finds it even if the worker dies mid-run"""
+    if session_manager is None:
+        return
+    try:
+        await session_manager.touch(config["configurable"]["thread_id"])
+    except Exception as e:
+        print(f"Could not touch session {config['configurable']['thread_id']}: {str(e)}")
+
+async def settle_session(config):
+    """Records the run on its session, pruning the session's checkpoints once it reached END"""
+    if email_agent is None or session_manager is None:
+        return
+    try:
+        await session_manager.settle(email_agent, config)
+    except Exception as e:
+        print(f"Could not settle session {config['configurable']['thread_id']}: {str(e)}")
+
 async def stream_events_generator(input_message, config):
     try:
         if email_agent is None:
             raise HTTPException(status_code=500, detail="Email agent not initialized")
+        await touch_session(config)
             
         # Send thread_id first
         yield json.dumps({
@@ -89,11 +125,14 @@ async def stream_events_generator(input_message, config):
                 yield json.dumps(final_data, indent=2) + "\n\n"
     except Exception as e:
         yield json.dumps({"type": "error", "data": str(e)}, indent=2) + "\n\n"
+    finally:
+        await settle_session(config)
 
 async def schedule_events_generator(config):
     try:
         if email_agent is None:
             raise HTTPException(status_code=500, detail="Email agent not initialized")
+        await touch_session(config)
             
         async for event in email_agent.astream(None, config, stream_mode="values"):
             if "messages" in event:
@@ -133,16 +172,32 @@ async def schedule_events_generator(config):
                         ]
                     }
                 }, indent=2) + "\n\n"
+
+            if event.get("meetings_failed"):
+                yield json.dumps({
+                    "type": "meetings_failed",
+                    "data": {
+                        "meetings": [
+                            {
+                                "summary": meeting["summary"],
+                                "error": meeting["error"]
+                            } for meeting in event["meetings_failed"]
+                        ]
+                    }
+                }, indent=2) + "\n\n"
             
             await asyncio.sleep(2)
     except Exception as e:
         yield json.dumps({"type": "error", "data": str(e)}, indent=2) + "\n\n"
+    finally:
+        await settle_session(config)
 
 @app.get("/api/fetch-meetings")
-async def fetch_meetings():
+async def fetch_meetings(user_id: str = Depends(authenticated_user_id)):
+    # The account comes from the API key, see MAILBUD_API_KEYS
     # Generate unique thread ID
     thread_id = str(uuid.uuid4())
-    config = {"configurable": {"thread_id": thread_id}}
+    config = {"configurable": {"thread_id": thread_id, "user_id": user_id}}
     
     input_message = ["Waiting for google account authentication to access Gmail and Calendar..."]
     
@@ -152,8 +207,13 @@ async def fetch_meetings():
     )
 
 @app.post("/api/schedule-meetings/{thread_id}")
-async def schedule_meetings(thread_id: str, resolution_input: ResolutionInput):
+async def schedule_meetings(thread_id: str, resolution_input: ResolutionInput, user_id: str = Depends(authenticated_user_id)):
     config = {"configurable": {"thread_id": thread_id}}
+    # Only the account that started the session, recorded in the checkpoint metadata, may resume it
+    state = await email_agent.aget_state(config)
+    if (state.metadata or {}).get("user_id", DEFAULT_USER_ID) != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    config["configurable"]["user_id"] = user_id
     
     # Update state with resolution input
     await email_agent.aupdate_state(config, {
@@ -165,6 +225,16 @@ async def schedule_meetings(thread_id: str, resolution_input: ResolutionInput):
         media_type="text/event-stream"
     )
 
+@app.get("/api/metrics/sessions")
+async def session_metrics():
+    if session_manager is None:
+        raise HTTPException(status_code=500, detail="Session manager not initialized")
+    return await session_manager.metrics()
+
+@app.get("/api/metrics/google-io")
+async def google_io_metrics():
+    return google_io_pool.metrics()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
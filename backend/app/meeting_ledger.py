@@ -0,0 +1,67 @@
+import os
+import json
+import time
+import asyncio
+import aiosqlite
+
+
+MEETING_LEDGER_PATH = os.getenv("MEETING_LEDGER_PATH", "meeting_ledger.db")
+
+
+class MeetingLedger:
+    """
+    Local record of the meetings already committed to an account's calendar, keyed
+    by their deterministic event id, so retried or resumed runs do not schedule them twice.
+    """
+
+    def __init__(self, path=MEETING_LEDGER_PATH):
+        self.path = path
+        self.conn = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._lock:
+            if self.conn is None:
+                conn = await aiosqlite.connect(self.path)
+                # Records written before they were scoped by account cannot be attributed. Dropping them
+                # is safe because inserting an event id that already exists returns the existing event
+                async with conn.execute("PRAGMA table_info(committed_meetings)") as cursor:
+                    columns = [row[1] async for row in cursor]
+                if columns and "account" not in columns:
+                    await conn.execute("DROP TABLE committed_meetings")
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS committed_meetings (
+                        account TEXT NOT NULL,
+                        calendar_id TEXT NOT NULL,
+                        event_id TEXT NOT NULL,
+                        result TEXT NOT NULL,
+                        committed_at REAL NOT NULL,
+                        PRIMARY KEY (account, calendar_id, event_id)
+                    )
+                """)
+                await conn.commit()
+                self.conn = conn
+        return self.conn
+
+    async def get(self, account, calendar_id, event_id):
+        """Returns the recorded result of a meeting committed to an account's calendar, None if it was never committed."""
+        conn = await self._connect()
+        async with conn.execute(
+            "SELECT result FROM committed_meetings WHERE account = ? AND calendar_id = ? AND event_id = ?",
+            (account, calendar_id, event_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def record(self, account, calendar_id, event_id, result):
+        conn = await self._connect()
+        await conn.execute(
+            "INSERT OR REPLACE INTO committed_meetings (account, calendar_id, event_id, result, committed_at) VALUES (?, ?, ?, ?, ?)",
+            (account, calendar_id, event_id, json.dumps(result), time.time())
+        )
+        await conn.commit()
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
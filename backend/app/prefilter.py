@@ -0,0 +1,68 @@
+import os
+import re
+
+
+# Threads scoring below this are not sent to the extraction model, the default keeps any thread with a meeting word or a time
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.3"))
+
+MEETING_WORDS = re.compile(
+    r"\b(meet|meeting|meetings|call|calls|sync|catch up|catch-up|schedule|scheduled|reschedule|"
+    r"appointment|interview|invite|invitation|calendar|availability|available|slot|zoom|"
+    r"google meet|teams|hangout|webex|conference|agenda|standup|stand-up|1:1|one-on-one|"
+    r"lunch|dinner|breakfast|coffee|drinks|demo|chat|talk|walk through|visit|come by|join)\b"
+)
+MEETING_LINK = re.compile(
+    r"(zoom\.us|meet\.google\.com|teams\.microsoft\.com|teams\.live\.com|webex\.com|calendly\.com|whereby\.com|gotomeeting\.com)/"
+)
+TIME_EXPRESSION = re.compile(
+    r"\b\d{1,2}(:\d{2})?\s?(am|pm|a\.m\.|p\.m\.)(?!\w)|\b([01]?\d|2[0-3]):[0-5]\d\b|\bnoon\b|\b(est|edt|cst|cdt|mst|mdt|pst|pdt|utc|gmt|ist|cet)\b|"
+    # 24-hour styles: 14h, 9h30, 17.00, and 1500 after a preposition so years and amounts do not count
+    r"\b([01]?\d|2[0-3])h([0-5]\d)?\b|(?<![\w$€£.])([01]?\d|2[0-3])\.[0-5]\d(?![\d.])|\b(at|after|before|by|until|from|around) ([01]\d|2[0-3])[0-5]\d\b"
+)
+DATE_EXPRESSION = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}(/\d{2,4})?\b|"
+    r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.? \d{1,2}(st|nd|rd|th)?\b|"
+    r"\b\d{1,2}(st|nd|rd|th)? (of )?(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b|"
+    # Bare ordinals such as "on the 24th"
+    r"\b(the|on|by|for) \d{1,2}(st|nd|rd|th)\b"
+)
+WEEKDAY = re.compile(r"\b(mon|tues|tue|wed|wednes|thu|thurs|fri|sat|satur|sun)(day)?\b")
+RELATIVE_DAY = re.compile(r"\b(today|tonight|tomorrow|next week|this week|next month|later today|end of day)\b")
+
+# Weight of each signal, counted once per thread
+SIGNAL_WEIGHTS = [
+    (MEETING_LINK, 1.0),
+    (MEETING_WORDS, 0.3),
+    (TIME_EXPRESSION, 0.3),
+    (DATE_EXPRESSION, 0.25),
+    (WEEKDAY, 0.25),
+    (RELATIVE_DAY, 0.2),
+]
+
+
+def scheduling_score(thread):
+    """
+    Scores how likely a thread is to contain meeting details, from 0 to 1.
+    Calendar invites score 1, otherwise meeting links, meeting words, times, dates,
+    weekdays and relative days found in the subject and message bodies add up.
+    """
+    if any(message.get("has_calendar_invite") for message in thread.messages):
+        return 1.0
+
+    text = " ".join([thread.subject or ""] + [message["msg_body"] or "" for message in thread.messages]).lower()
+    score = sum(weight for pattern, weight in SIGNAL_WEIGHTS if pattern.search(text))
+    return min(score, 1.0)
+
+
+def prefilter_threads(threads, threshold=None):
+    """
+    Splits threads into the ones worth sending to the extraction model and the rest.
+
+    Returns:
+        tuple: Threads scoring at least threshold, and the remaining threads, both in input order
+    """
+    threshold = PREFILTER_THRESHOLD if threshold is None else threshold
+    kept, dropped = [], []
+    for thread in threads:
+        (kept if scheduling_score(thread) >= threshold else dropped).append(thread)
+    return kept, dropped
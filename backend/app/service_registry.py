@@ -0,0 +1,69 @@
+import os
+import asyncio
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+
+# Number of accounts whose authenticated clients are kept in memory
+SERVICE_REGISTRY_MAX_ACCOUNTS = int(os.getenv("SERVICE_REGISTRY_MAX_ACCOUNTS", "100"))
+
+
+class AccountServices(NamedTuple):
+    gmail: Any
+    calendar: Any
+
+
+class ServiceRegistry:
+    """
+    Authenticated Gmail and Calendar clients per account, keyed by user id.
+
+    Clients are built once per account by the authenticator returned by
+    authenticator_factory(user_id) and reused by every session of that account.
+    Concurrent first requests for an account share a single authentication, and
+    the least recently used accounts are dropped beyond max_accounts.
+    """
+
+    def __init__(self, authenticator_factory, max_accounts=SERVICE_REGISTRY_MAX_ACCOUNTS):
+        self.authenticator_factory = authenticator_factory
+        self.max_accounts = max_accounts
+        self.entries = OrderedDict()
+        self._locks = {}
+
+    def put(self, user_id, services):
+        """Registers already authenticated clients for an account."""
+        self.entries[user_id] = services
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_accounts:
+            evicted, _ = self.entries.popitem(last=False)
+            self._locks.pop(evicted, None)
+
+    async def get(self, user_id):
+        """
+        Returns the clients of an account, authenticating it on first use.
+        Args:
+            user_id: The account the clients act for
+
+        Returns:
+            AccountServices: The Gmail and Calendar clients of the account
+        """
+        if user_id in self.entries:
+            self.entries.move_to_end(user_id)
+            return self.entries[user_id]
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            if user_id not in self.entries:
+                authenticator = self.authenticator_factory(user_id)
+                self.put(user_id, AccountServices(
+                    gmail=await authenticator.get_gmail_service(),
+                    calendar=await authenticator.get_calendar_service()
+                ))
+        return self.entries[user_id]
+
+    def evict(self, user_id):
+        """Drops the clients of an account, for example after its credentials were revoked."""
+        self.entries.pop(user_id, None)
+        self._locks.pop(user_id, None)
+
+    def __len__(self):
+        return len(self.entries)
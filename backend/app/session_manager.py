@@ -0,0 +1,175 @@
+import os
+import time
+import asyncio
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+
+# Sessions not touched for this long are considered abandoned and deleted
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+
+# Checkpoint tables holding rows per thread_id, for each checkpointer backend
+CHECKPOINT_TABLES = {
+    "sqlite": ["writes", "checkpoints"],
+    "postgres": ["checkpoint_writes", "checkpoint_blobs", "checkpoints"],
+}
+# Tables holding rows per checkpoint, which are pruned down to the latest one
+PRUNABLE_TABLES = {
+    "sqlite": ["writes", "checkpoints"],
+    "postgres": ["checkpoint_writes", "checkpoints"],
+}
+
+
+class SessionManager:
+    """
+    Lifecycle of the agent sessions stored by the checkpointer.
+
+    Every request touches its session. Once a session reaches END its intermediate
+    checkpoints are pruned, keeping only the latest one, and sessions not touched for
+    ttl seconds are deleted by a background sweeper. The session table lives next to
+    the checkpoints, so every worker sharing the store sees the same sessions.
+    Checkpoints without a session, left by a worker that died before touching it, are
+    adopted by the sweeper and expire ttl seconds later.
+    """
+
+    def __init__(self, checkpointer, ttl=SESSION_TTL_SECONDS, sweep_interval=SESSION_SWEEP_INTERVAL_SECONDS):
+        self.checkpointer = checkpointer
+        self.dialect = "sqlite" if isinstance(checkpointer, AsyncSqliteSaver) else "postgres"
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+
+    async def _execute(self, sql, params=(), fetch=False):
+        if self.dialect == "sqlite":
+            async with self.checkpointer.lock:
+                async with self.checkpointer.conn.execute(sql, params) as cursor:
+                    rows = await cursor.fetchall() if fetch else None
+                await self.checkpointer.conn.commit()
+            return rows
+
+        async with self.checkpointer.conn.connection() as conn:
+            cursor = await conn.execute(sql.replace("?", "%s"), params)
+            return await cursor.fetchall() if fetch else None
+
+    async def setup(self):
+        await self.checkpointer.setup()
+        await self._execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                thread_id TEXT PRIMARY KEY,
+                created_at DOUBLE PRECISION NOT NULL,
+                touched_at DOUBLE PRECISION NOT NULL,
+                finished_at DOUBLE PRECISION
+            )
+        """)
+
+    async def touch(self, thread_id):
+        now = time.time()
+        await self._execute(
+            "INSERT INTO sessions (thread_id, created_at, touched_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (thread_id) DO UPDATE SET touched_at = excluded.touched_at",
+            (thread_id, now, now)
+        )
+
+    async def prune(self, thread_id):
+        """Deletes every checkpoint of a session but the latest one of each namespace, with their writes."""
+        for table in PRUNABLE_TABLES[self.dialect]:
+            await self._execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id NOT IN ("
+                "SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? GROUP BY checkpoint_ns)",
+                (thread_id, thread_id)
+            )
+        if self.dialect == "postgres":
+            # Channel values are stored once per version, keep the versions the remaining checkpoints use
+            await self._execute(
+                "DELETE FROM checkpoint_blobs b WHERE b.thread_id = ? AND NOT EXISTS ("
+                "SELECT 1 FROM checkpoints c WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns "
+                "AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version)",
+                (thread_id,)
+            )
+
+    async def settle(self, graph, config):
+        """
+        Records activity on a session after a graph run, pruning it once the run reached END.
+        Args:
+            graph: The compiled graph the session ran on
+            config: The run config holding the thread_id
+
+        Returns:
+            bool: Whether the session is finished
+        """
+        thread_id = config["configurable"]["thread_id"]
+        await self.touch(thread_id)
+        state = await graph.aget_state(config)
+        if state.next:
+            return False
+
+        await self.prune(thread_id)
+        await self._execute("UPDATE sessions SET finished_at = ? WHERE thread_id = ?", (time.time(), thread_id))
+        return True
+
+    async def delete(self, thread_id):
+        for table in CHECKPOINT_TABLES[self.dialect]:
+            await self._execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        await self._execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+
+    async def adopt_orphans(self):
+        """Records a session for checkpoints that have none, so they expire like any other session."""
+        now = time.time()
+        await self._execute(
+            "INSERT INTO sessions (thread_id, created_at, touched_at) "
+            "SELECT DISTINCT thread_id, ?, ? FROM checkpoints WHERE thread_id NOT IN (SELECT thread_id FROM sessions) "
+            "ON CONFLICT (thread_id) DO NOTHING",
+            (now, now)
+        )
+
+    async def expire(self):
+        """Deletes the sessions not touched within ttl seconds, returning how many were removed."""
+        await self.adopt_orphans()
+        rows = await self._execute(
+            "SELECT thread_id FROM sessions WHERE touched_at < ?", (time.time() - self.ttl,), fetch=True
+        )
+        for (thread_id,) in rows:
+            await self.delete(thread_id)
+        if rows:
+            print(f"Expired {len(rows)} sessions")
+        return len(rows)
+
+    async def metrics(self):
+        (live, finished), = await self._execute(
+            "SELECT COUNT(*) - COUNT(finished_at), COUNT(finished_at) FROM sessions", fetch=True
+        )
+        (checkpoints,), = await self._execute("SELECT COUNT(*) FROM checkpoints", fetch=True)
+        if self.dialect == "sqlite":
+            (store_bytes,), = await self._execute(
+                "SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()", fetch=True
+            )
+        else:
+            size = " + ".join(f"pg_total_relation_size('{table}')" for table in CHECKPOINT_TABLES["postgres"])
+            (store_bytes,), = await self._execute(f"SELECT {size}", fetch=True)
+        return {
+            "live_sessions": live,
+            "finished_sessions": finished,
+            "checkpoints": checkpoints,
+            "store_bytes": store_bytes,
+        }
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.expire()
+            except Exception as e:
+                print(f"Session sweep failed: {str(e)}")
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
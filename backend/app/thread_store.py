@@ -0,0 +1,135 @@
+import os
+import time
+import asyncio
+import aiosqlite
+
+
+THREAD_STORE_PATH = os.getenv("THREAD_STORE_PATH", "thread_store.db")
+THREAD_STORE_MAX_BYTES = int(os.getenv("THREAD_STORE_MAX_BYTES", str(50 * 1024 * 1024)))
+THREAD_STORE_MAX_AGE_DAYS = float(os.getenv("THREAD_STORE_MAX_AGE_DAYS", "30"))
+
+# Marker for threads that were fetched but did not qualify for extraction
+NOT_QUALIFIED = None
+
+
+class ThreadStore:
+    """
+    SQLite cache of parsed threads keyed by thread id.
+
+    A cached thread is only returned while its historyId matches the one
+    reported by threads.list, so threads with new messages are fetched again.
+    Entries are evicted once older than max_age_days, and the least recently
+    used ones are evicted while the store is larger than max_bytes.
+    """
+
+    def __init__(self, path=THREAD_STORE_PATH, max_bytes=THREAD_STORE_MAX_BYTES, max_age_days=THREAD_STORE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.conn = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._lock:
+            if self.conn is None:
+                conn = await aiosqlite.connect(self.path)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS threads (
+                        thread_id TEXT PRIMARY KEY,
+                        history_id TEXT NOT NULL,
+                        payload TEXT,
+                        size INTEGER NOT NULL,
+                        stored_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_stored_at ON threads (stored_at)")
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_accessed_at ON threads (accessed_at)")
+                await conn.commit()
+                self.conn = conn
+        return self.conn
+
+    async def get_many(self, threads):
+        """
+        Looks up the given thread stubs.
+        Args:
+            threads: Thread stubs with "id" and, when known, "historyId"
+
+        Returns:
+            dict: Thread id to the stored payload (NOT_QUALIFIED for threads that
+            did not qualify) for every thread whose historyId is unchanged
+        """
+        wanted = {thread["id"]: thread.get("historyId") for thread in threads if thread.get("historyId")}
+        if not wanted:
+            return {}
+
+        conn = await self._connect()
+        found = {}
+        ids = list(wanted)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            async with conn.execute(
+                f"SELECT thread_id, history_id, payload FROM threads WHERE thread_id IN ({placeholders})", chunk
+            ) as cursor:
+                async for thread_id, history_id, payload in cursor:
+                    if history_id == str(wanted[thread_id]):
+                        found[thread_id] = payload
+
+        if found:
+            now = time.time()
+            await conn.executemany(
+                "UPDATE threads SET accessed_at = ? WHERE thread_id = ?",
+                [(now, thread_id) for thread_id in found]
+            )
+            await conn.commit()
+        return found
+
+    async def put_many(self, entries):
+        """
+        Stores parsed threads.
+        Args:
+            entries: List of (thread_id, history_id, payload) tuples, payload being NOT_QUALIFIED
+            for threads that did not qualify for extraction
+        """
+        if not entries:
+            return
+        conn = await self._connect()
+        now = time.time()
+        await conn.executemany(
+            """
+            INSERT OR REPLACE INTO threads (thread_id, history_id, payload, size, stored_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (thread_id, str(history_id), payload, len(payload or ""), now, now)
+                for thread_id, history_id, payload in entries
+            ]
+        )
+        await conn.commit()
+        await self.evict()
+
+    async def evict(self):
+        """Removes expired entries, then least recently used ones until the store fits in max_bytes."""
+        conn = await self._connect()
+        await conn.execute("DELETE FROM threads WHERE stored_at < ?", (time.time() - self.max_age,))
+
+        async with conn.execute("SELECT COALESCE(SUM(size), 0) FROM threads") as cursor:
+            (total,) = await cursor.fetchone()
+
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            evicted = []
+            async with conn.execute("SELECT thread_id, size FROM threads ORDER BY accessed_at") as cursor:
+                async for thread_id, size in cursor:
+                    if excess <= 0:
+                        break
+                    evicted.append((thread_id,))
+                    excess -= size
+            await conn.executemany("DELETE FROM threads WHERE thread_id = ?", evicted)
+        await conn.commit()
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
@@ -0,0 +1,87 @@
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+# Formats seen in extracted meeting times that datetime.fromisoformat does not accept
+FALLBACK_FORMATS = [
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d %H:%M",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y %I:%M %p",
+    "%Y-%m-%d %I:%M %p",
+    "%B %d, %Y %I:%M %p",
+    "%b %d, %Y %I:%M %p",
+]
+
+UTC_OFFSET_PATTERN = re.compile(r"^(?:UTC|GMT)?\s*([+-])(\d{1,2}):?(\d{2})?$", re.IGNORECASE)
+
+
+def parse_timezone(name):
+    """Returns a tzinfo for an IANA name, UTC/GMT or a UTC offset such as "-0700", None if unknown."""
+    if not name:
+        return None
+    name = name.strip()
+    if name.upper() in ("UTC", "GMT", "Z"):
+        return dt_timezone.utc
+    match = UTC_OFFSET_PATTERN.match(name)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return dt_timezone(-offset if sign == "-" else offset)
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def parse_datetime(timestamp_str):
+    """Parses ISO 8601, RFC 2822 and a few common formats, returning None when none of them match."""
+    try:
+        return datetime.fromisoformat(timestamp_str)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(timestamp_str)
+    except (TypeError, ValueError):
+        pass
+    for fmt in FALLBACK_FORMATS:
+        try:
+            return datetime.strptime(timestamp_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=1024)
+def normalize_rfc3339(timestamp_str, timezone=None):
+    """
+    Converts a timestamp to RFC3339.
+    Timestamps carrying an offset keep it, naive ones are interpreted in the given
+    timezone (an IANA name or a UTC offset), or in UTC when it is missing or unknown.
+    Args:
+        timestamp_str: The timestamp to convert
+        timezone: The timezone of naive timestamps
+
+    Returns:
+        str: The RFC3339 timestamp, or None if the timestamp could not be parsed
+    """
+    if not timestamp_str:
+        return None
+    parsed = parse_datetime(timestamp_str.strip())
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=parse_timezone(timezone) or dt_timezone.utc)
+    return parsed.isoformat(timespec="seconds")
+
+
+def to_utc(timestamp_str, timezone=None):
+    """Returns the instant of a timestamp as an aware UTC datetime, None if it could not be parsed."""
+    normalized = normalize_rfc3339(timestamp_str, timezone)
+    if normalized is None:
+        return None
+    return datetime.fromisoformat(normalized).astimezone(dt_timezone.utc)
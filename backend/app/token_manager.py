@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import tempfile
+from datetime import datetime, timezone
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+
+
+# Access tokens expiring within this margin are refreshed ahead of time
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "600"))
+TOKEN_REFRESH_INTERVAL_SECONDS = float(os.getenv("TOKEN_REFRESH_INTERVAL_SECONDS", "60"))
+# Accounts not used for this long are no longer kept refreshed
+TOKEN_KEEP_WARM_SECONDS = float(os.getenv("TOKEN_KEEP_WARM_SECONDS", str(24 * 60 * 60)))
+
+
+def expires_within(creds, seconds):
+    """Checks whether credentials expire within the given number of seconds, google-auth keeps expiry as naive UTC."""
+    if creds.expiry is None:
+        return False
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (creds.expiry - now).total_seconds() < seconds
+
+
+def write_token(token_path, content):
+    """Writes a token file through a temporary file and a rename, so readers never see a partial token."""
+    directory = os.path.dirname(token_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, token_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class TokenManager:
+    """
+    Loads, refreshes and stores the OAuth credentials of every account, keyed by token file.
+
+    Token files are read, written and refreshed in the default executor, never on
+    the event loop. Concurrent refreshes of one account share a single round trip,
+    and a background task refreshes the accounts used within keep_warm seconds
+    before their access token expires, so requests find a valid token. Sessions
+    served by already built clients record their use through touch().
+    """
+
+    def __init__(self, scopes, refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS, refresh_interval=TOKEN_REFRESH_INTERVAL_SECONDS, keep_warm=TOKEN_KEEP_WARM_SECONDS):
+        self.scopes = scopes
+        self.refresh_margin = refresh_margin
+        self.refresh_interval = refresh_interval
+        self.keep_warm = keep_warm
+        self.accounts = {}
+        self.used_at = {}
+        self._locks = {}
+        self._refresher = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    def _read(self, token_path):
+        if not os.path.exists(token_path):
+            return None
+        return Credentials.from_authorized_user_file(token_path, self.scopes)
+
+    async def get(self, token_path):
+        """
+        Returns the credentials stored in a token file, refreshed if they expire soon.
+        Args:
+            token_path: The token file of the account
+
+        Returns:
+            Credentials: Usable credentials, or None when the account has to sign in again
+        """
+        self.touch(token_path)
+        creds = self.accounts.get(token_path)
+        if creds is not None and creds.valid and not expires_within(creds, self.refresh_margin):
+            return creds
+
+        async with self._locks.setdefault(token_path, asyncio.Lock()):
+            creds = self.accounts.get(token_path)
+            if creds is None:
+                try:
+                    creds = await self._run(self._read, token_path)
+                except Exception as e:
+                    print(f"Error loading existing credentials: {e}")
+                    return None
+                if creds is None:
+                    return None
+                self.accounts[token_path] = creds
+            await self._refresh(token_path, creds)
+        return creds if creds.valid else None
+
+    def touch(self, token_path):
+        """Records that an account is in use, keeping its token refreshed for another keep_warm seconds."""
+        self.used_at[token_path] = time.time()
+
+    async def _refresh(self, token_path, creds):
+        if not creds.refresh_token or (creds.valid and not expires_within(creds, self.refresh_margin)):
+            return
+        try:
+            await self._run(creds.refresh, Request())
+        except Exception as e:
+            print(f"Error refreshing credentials: {e}")
+            return
+        await self._run(write_token, token_path, creds.to_json())
+
+    async def refresh(self, token_path):
+        """Refreshes the access token of an account and writes it back, unless a concurrent call just did."""
+        async with self._locks.setdefault(token_path, asyncio.Lock()):
+            creds = self.accounts.get(token_path)
+            if creds is not None:
+                await self._refresh(token_path, creds)
+
+    async def register(self, token_path, creds):
+        """Keeps credentials obtained from a sign-in and stores them in the token file."""
+        self.accounts[token_path] = creds
+        self.used_at[token_path] = time.time()
+        await self._run(write_token, token_path, creds.to_json())
+
+    async def refresh_expiring(self):
+        """Refreshes the recently used accounts whose access token expires within the margin, forgetting idle ones."""
+        idle_before = time.time() - self.keep_warm
+        for token_path in list(self.accounts):
+            if self.used_at.get(token_path, 0) < idle_before:
+                self.accounts.pop(token_path, None)
+                self.used_at.pop(token_path, None)
+                self._locks.pop(token_path, None)
+            elif expires_within(self.accounts[token_path], self.refresh_margin):
+                await self.refresh(token_path)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_expiring()
+            except Exception as e:
+                print(f"Token refresh failed: {str(e)}")
+
+    def start(self):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
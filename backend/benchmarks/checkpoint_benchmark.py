@@ -0,0 +1,147 @@
+"""
+Compares the checkpoints written while running the agent's nodes with full
+threads in the graph state (before) and with blob store references (after):
+serialized checkpoint bytes and checkpoint write latency per node.
+
+The nodes replay synthetic outputs, so no Google or model calls are made.
+
+Run from the backend directory:
+    python -m benchmarks.checkpoint_benchmark [threads] [messages_per_thread]
+"""
+import sys
+import time
+import asyncio
+import tempfile
+import aiosqlite
+from typing import List, Dict
+from unittest.mock import patch
+from langgraph.graph import StateGraph, MessagesState, START, END
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from app.email_agent import Thread, Message, ThreadRef, MeetingDetailsList, store_threads
+from app.blob_store import BlobStore
+
+NODES = ["get_threads_with_messages", "extract_meeting_details", "events_to_schedule", "fetch_conflicting_events_for_meeting", "create_meeting_events"]
+
+
+class BeforeState(MessagesState):
+    threads_with_messages: List[Thread]
+    meeting_details: MeetingDetailsList
+    events_to_be_scheduled: Dict
+    conflicting_events: List[Dict]
+    conflict_snapshot: Dict[str, List[Dict]]
+    meetings_scheduled: List[Dict]
+
+
+class AfterState(MessagesState):
+    thread_refs: List[ThreadRef]
+    meeting_details: MeetingDetailsList
+    events_to_be_scheduled: Dict
+    conflicting_events: List[Dict]
+    conflict_snapshot: Dict[str, List[Dict]]
+    meetings_scheduled: List[Dict]
+
+
+class MeasuredSaver(AsyncSqliteSaver):
+    """Records the serialized size and write latency of every checkpoint, by the node that produced it."""
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.samples = []
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        start = time.perf_counter()
+        result = await super().aput(config, checkpoint, metadata, new_versions)
+        elapsed = time.perf_counter() - start
+        node = next(iter(metadata.get("writes") or {}), "input")
+        self.samples.append((node, len(self.serde.dumps_typed(checkpoint)[1]), elapsed))
+        return result
+
+
+def synthetic_threads(count, messages_per_thread):
+    body = "Following up on the roadmap review, can we meet Tuesday at 3pm to go through the open items? " * 15
+    return [
+        Thread(thread_id=f"thread_{i}", subject=f"Roadmap review {i}", messages=[
+            Message(msg_id=f"msg_{i}_{j}", msg_body=body, from_="a@example.com", to=["b@example.com"], timestamp="Thu, 25 Apr 2024 10:00:00 -0400")
+            for j in range(messages_per_thread)
+        ])
+        for i in range(count)
+    ]
+
+
+def synthetic_meetings(count):
+    return {"meetings": [
+        {
+            "id": f"mailbud{i:020d}",
+            "summary": f"Roadmap review {i}",
+            "start": {"dateTime": f"2024-05-{i % 28 + 1:02d}T15:00:00-04:00", "timeZone": "America/New_York"},
+            "end": {"dateTime": f"2024-05-{i % 28 + 1:02d}T16:00:00-04:00", "timeZone": "America/New_York"},
+            "location": "Online",
+            "description": "Go through the open items",
+            "attendees": [{"email": "a@example.com"}, {"email": "b@example.com"}],
+        }
+        for i in range(count)
+    ]}
+
+
+def build_graph(state, updates, memory):
+    builder = StateGraph(state)
+    for node in NODES:
+        builder.add_node(node, lambda _, node=node: updates[node])
+    builder.add_edge(START, NODES[0])
+    for source, target in zip(NODES, NODES[1:]):
+        builder.add_edge(source, target)
+    builder.add_edge(NODES[-1], END)
+    return builder.compile(checkpointer=memory)
+
+
+async def run(state, updates, path):
+    memory = MeasuredSaver(await aiosqlite.connect(path))
+    graph = build_graph(state, updates, memory)
+    await graph.ainvoke({"messages": ["start"]}, {"configurable": {"thread_id": "benchmark"}})
+    await memory.conn.close()
+    return memory.samples
+
+
+async def main():
+    thread_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    messages_per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    threads = synthetic_threads(thread_count, messages_per_thread)
+    events = synthetic_meetings(10)
+    common = {
+        "extract_meeting_details": {"meeting_details": MeetingDetailsList(meetings="NONE"), "messages": ["Extracted"]},
+        "events_to_schedule": {"events_to_be_scheduled": events, "messages": ["Formatted"]},
+        "create_meeting_events": {"meetings_scheduled": events["meetings"], "messages": ["Scheduled"]},
+    }
+    snapshot = {"conflicting_events": "NONE", "conflict_snapshot": {}, "messages": ["Checked conflicts"]}
+
+    with tempfile.TemporaryDirectory() as directory:
+        before = await run(BeforeState, {
+            **common,
+            "get_threads_with_messages": {"threads_with_messages": threads, "messages": ["Retrieved"]},
+            # The conflict check used to hand the meetings back unchanged
+            "fetch_conflicting_events_for_meeting": {**snapshot, "events_to_be_scheduled": events},
+        }, f"{directory}/before.db")
+
+        blob_store = BlobStore(f"{directory}/blobs.db")
+        with patch("app.email_agent.blob_store", blob_store):
+            start = time.perf_counter()
+            thread_refs = await store_threads(threads)
+            blob_write = time.perf_counter() - start
+        await blob_store.close()
+        after = await run(AfterState, {
+            **common,
+            "get_threads_with_messages": {"thread_refs": thread_refs, "messages": ["Retrieved"]},
+            "fetch_conflicting_events_for_meeting": snapshot,
+        }, f"{directory}/after.db")
+
+    print(f"{thread_count} threads of {messages_per_thread} messages")
+    print(f"{'node':<40}{'before bytes':>14}{'after bytes':>14}{'before ms':>11}{'after ms':>10}")
+    for (node, before_bytes, before_time), (_, after_bytes, after_time) in zip(before, after):
+        print(f"{node:<40}{before_bytes:>14}{after_bytes:>14}{before_time * 1000:>11.2f}{after_time * 1000:>10.2f}")
+    print(f"{'total':<40}{sum(s[1] for s in before):>14}{sum(s[1] for s in after):>14}"
+          f"{sum(s[2] for s in before) * 1000:>11.2f}{sum(s[2] for s in after) * 1000:>10.2f}")
+    print(f"one-time blob store write of the threads: {blob_write * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+"""
+Measures the time to build the Gmail and Calendar clients of a fresh session,
+with googleapiclient's build() against build_service() from the cached
+discovery documents, before and after warm_discovery_documents() ran.
+
+Run from the backend directory:
+    python -m benchmarks.discovery_benchmark [rounds]
+"""
+import sys
+import time
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+from app.google_api import DISCOVERY_APIS, build_service, discovery_document, warm_discovery_documents
+
+
+def build_clients(builder):
+    start = time.perf_counter()
+    for service_name, version in DISCOVERY_APIS:
+        builder(service_name, version, AnonymousCredentials())
+    return time.perf_counter() - start
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    build_with_discovery = lambda service_name, version, credentials: build(service_name, version, credentials=credentials)
+
+    uncached = sum(build_clients(build_with_discovery) for _ in range(rounds)) / rounds
+    discovery_document.cache_clear()
+    cold = build_clients(build_service)
+    discovery_document.cache_clear()
+    start = time.perf_counter()
+    warm_discovery_documents()
+    warm_up = time.perf_counter() - start
+    warm = sum(build_clients(build_service) for _ in range(rounds)) / rounds
+
+    print(f"build() per session:                     {uncached * 1000:.2f} ms")
+    print(f"build_service() first session, cold:     {cold * 1000:.2f} ms")
+    print(f"build_service() per session, warm:       {warm * 1000:.2f} ms")
+    print(f"warm_discovery_documents() at startup:   {warm_up * 1000:.2f} ms")
+    print(f"saved per session:                       {(uncached - warm) * 1000:.2f} ms ({1 - warm / uncached:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Measures the scheduling prefilter against the labeled threads in
+tests/fixtures/prefilter_threads.json: recall of scheduling threads, share of
+threads and prompt tokens kept away from the extraction model, and scoring time.
+Every scheduling thread the filter would drop is listed with its score.
+
+Run from the backend directory:
+    python -m benchmarks.prefilter_benchmark [threshold]
+"""
+import sys
+import time
+from tests.test_prefilter import load_labeled_threads
+from app.prefilter import prefilter_threads, scheduling_score, PREFILTER_THRESHOLD
+from app.email_agent import estimate_tokens
+
+
+def main():
+    threshold = float(sys.argv[1]) if len(sys.argv) > 1 else PREFILTER_THRESHOLD
+    labeled = load_labeled_threads()
+    threads = [thread for thread, _ in labeled]
+
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        kept, dropped = prefilter_threads(threads, threshold)
+    elapsed = time.perf_counter() - start
+
+    kept_ids = {thread.thread_id for thread in kept}
+    positives = [thread for thread, scheduling in labeled if scheduling]
+    true_positives = [thread for thread in positives if thread.thread_id in kept_ids]
+    total_tokens = sum(estimate_tokens(str(thread)) for thread in threads)
+    kept_tokens = sum(estimate_tokens(str(thread)) for thread in kept)
+
+    print(f"threshold:           {threshold}")
+    print(f"threads:             {len(threads)} ({len(positives)} scheduling)")
+    print(f"recall:              {len(true_positives) / len(positives):.2%}")
+    print(f"precision:           {len(true_positives) / max(1, len(kept)):.2%}")
+    print(f"threads skipped:     {len(dropped)} ({len(dropped) / len(threads):.0%})")
+    print(f"prompt tokens saved: {total_tokens - kept_tokens} of {total_tokens} ({1 - kept_tokens / total_tokens:.0%})")
+    print(f"scoring time:        {elapsed / (rounds * len(threads)) * 1e6:.1f} us per thread")
+
+    missed = [thread for thread in positives if thread.thread_id not in kept_ids]
+    print(f"missed:              {len(missed)} scheduling threads")
+    for thread in missed:
+        print(f"  {thread.thread_id:<6}{scheduling_score(thread):.2f}  {thread.subject}")
+
+
+if __name__ == "__main__":
+    main()
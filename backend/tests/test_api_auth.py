@@ -0,0 +1,41 @@
+import pytest
+from unittest.mock import patch
+from fastapi import HTTPException
+from app.api_auth import parse_api_keys, user_for_authorization, authenticated_user_id
+
+
+def test_api_keys_are_parsed_into_users():
+    assert parse_api_keys("k1:alice, k2:bob,,broken") == {"k1": "alice", "k2": "bob"}
+
+
+def test_only_known_bearer_keys_identify_a_user():
+    api_keys = {"k1": "alice"}
+
+    assert user_for_authorization("Bearer k1", api_keys) == "alice"
+    assert user_for_authorization("Bearer k2", api_keys) is None
+    assert user_for_authorization("k1", api_keys) is None
+    assert user_for_authorization(None, api_keys) is None
+
+
+def test_without_api_keys_only_the_default_account_is_served():
+    with patch("app.api_auth.API_KEYS", {}):
+        assert authenticated_user_id("Bearer anything") == "default"
+
+
+def test_requests_without_a_valid_key_are_rejected():
+    with patch("app.api_auth.API_KEYS", {"k1": "alice"}):
+        with pytest.raises(HTTPException) as exc_info:
+            authenticated_user_id(None)
+
+    assert exc_info.value.status_code == 401
+
+
+def test_accounts_that_never_signed_in_are_rejected_instead_of_starting_a_sign_in(tmp_path):
+    (tmp_path / "alice.json").write_text("{}")
+
+    with patch("app.api_auth.API_KEYS", {"k1": "alice", "k2": "bob"}), patch("app.email_agent.GOOGLE_TOKEN_DIR", str(tmp_path)):
+        assert authenticated_user_id("Bearer k1") == "alice"
+        with pytest.raises(HTTPException) as exc_info:
+            authenticated_user_id("Bearer k2")
+
+    assert exc_info.value.status_code == 403
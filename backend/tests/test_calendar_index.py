@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+from app.calendar_index import IntervalIndex, event_bounds
+
+
+def event(event_id, start, end):
+    return {"id": event_id, "start": {"dateTime": start}, "end": {"dateTime": end}}
+
+
+def utc(hour, minute=0):
+    return datetime(2024, 4, 25, hour, minute, tzinfo=timezone.utc)
+
+
+def test_overlapping_returns_events_intersecting_the_window():
+    index = IntervalIndex.from_events([
+        event("long", "2024-04-25T06:00:00Z", "2024-04-25T12:00:00Z"),
+        event("before", "2024-04-25T08:00:00Z", "2024-04-25T09:00:00Z"),
+        event("touching", "2024-04-25T09:00:00Z", "2024-04-25T10:00:00Z"),
+        event("inside", "2024-04-25T10:15:00Z", "2024-04-25T10:45:00Z"),
+        event("after", "2024-04-25T11:00:00Z", "2024-04-25T12:00:00Z"),
+    ])
+
+    overlapping = index.overlapping(utc(10), utc(11))
+
+    assert [item["id"] for item in overlapping] == ["long", "inside"]
+
+
+def test_event_bounds_handles_offsets_and_all_day_events():
+    assert event_bounds(event("e", "2024-04-25T14:00:00-04:00", "2024-04-25T15:00:00-04:00")) == (utc(18), utc(19))
+    all_day = {"start": {"date": "2024-04-25"}, "end": {"date": "2024-04-26"}}
+    assert event_bounds(all_day) == (utc(0), datetime(2024, 4, 26, tzinfo=timezone.utc))
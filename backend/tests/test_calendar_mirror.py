@@ -0,0 +1,122 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+from googleapiclient.errors import HttpError
+from app.calendar_mirror import CalendarMirror
+
+pytestmark = pytest.mark.asyncio
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def event(event_id, hours_from_now, duration_hours=1, **fields):
+    start = NOW + timedelta(hours=hours_from_now)
+    return {
+        "id": event_id,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + timedelta(hours=duration_hours)).isoformat()},
+        **fields
+    }
+
+
+def calendar_service(responses):
+    """Answers events.list with the given responses in order, recording the parameters of each call."""
+    service = Mock()
+    service.calls = []
+
+    def list_events(**params):
+        service.calls.append(params)
+        request = Mock()
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            request.execute.side_effect = response
+        else:
+            request.execute.return_value = response
+        return request
+
+    service.events().list = Mock(side_effect=list_events)
+    return service
+
+
+@pytest_asyncio.fixture
+async def mirror(tmp_path):
+    mirror = CalendarMirror(path=str(tmp_path / "mirror.db"), window_days=30, max_staleness=0)
+    yield mirror
+    await mirror.close()
+
+
+@pytest.mark.asyncio
+async def test_full_sync_then_range_queries(mirror):
+    service = calendar_service([{"items": [event("a", 1), event("b", 5)], "nextSyncToken": "token_1"}])
+
+    await mirror.sync(service, "alice")
+
+    found = await mirror.events_between("alice", "primary", NOW + timedelta(hours=1, minutes=30), NOW + timedelta(hours=3))
+    assert [item["id"] for item in found] == ["a"]
+    assert "timeMin" in service.calls[0]
+    assert await mirror.covers("alice", "primary", NOW, NOW + timedelta(days=10))
+    assert not await mirror.covers("alice", "primary", NOW, NOW + timedelta(days=60))
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_applies_changes(mirror):
+    service = calendar_service([
+        {"items": [event("a", 1), event("b", 5)], "nextSyncToken": "token_1"},
+        {"items": [{"id": "a", "status": "cancelled"}, event("c", 2)], "nextSyncToken": "token_2"},
+    ])
+
+    await mirror.sync(service, "alice")
+    await mirror.sync(service, "alice")
+
+    found = await mirror.events_between("alice", "primary", NOW, NOW + timedelta(days=1))
+    assert [item["id"] for item in found] == ["c", "b"]
+    assert service.calls[1]["syncToken"] == "token_1"
+    assert "timeMin" not in service.calls[1]
+
+
+@pytest.mark.asyncio
+async def test_expired_sync_token_triggers_full_resync(mirror):
+    service = calendar_service([
+        {"items": [event("a", 1)], "nextSyncToken": "token_1"},
+        HttpError(Mock(status=410, reason="Gone"), b"error"),
+        {"items": [event("b", 2)], "nextSyncToken": "token_2"},
+    ])
+
+    await mirror.sync(service, "alice")
+    await mirror.sync(service, "alice")
+
+    found = await mirror.events_between("alice", "primary", NOW, NOW + timedelta(days=1))
+    assert [item["id"] for item in found] == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_mirror_persists_across_restarts(tmp_path):
+    path = str(tmp_path / "mirror.db")
+    first = CalendarMirror(path=path, window_days=30)
+    await first.sync(calendar_service([{"items": [event("a", 1)], "nextSyncToken": "token_1"}]), "alice")
+    await first.close()
+
+    second = CalendarMirror(path=path, window_days=30)
+    service = calendar_service([])
+    await second.sync(service, "alice")
+    found = await second.events_between("alice", "primary", NOW, NOW + timedelta(days=1))
+    await second.close()
+
+    assert [item["id"] for item in found] == ["a"]
+    assert service.calls == []
+
+
+@pytest.mark.asyncio
+async def test_accounts_are_mirrored_separately(mirror):
+    alice = calendar_service([{"items": [event("doctor", 1)], "nextSyncToken": "alice_1"}])
+    bob = calendar_service([{"items": [event("standup", 2)], "nextSyncToken": "bob_1"}])
+    fresh = CalendarMirror(path=mirror.path, window_days=30, max_staleness=60)
+
+    await fresh.sync(alice, "alice")
+    await fresh.sync(bob, "bob")
+    found = await fresh.events_between("bob", "primary", NOW, NOW + timedelta(days=1))
+    await fresh.close()
+
+    assert [item["id"] for item in found] == ["standup"]
+    assert "syncToken" not in bob.calls[0]
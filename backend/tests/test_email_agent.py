@@ -1,9 +1,14 @@
+import json
+import time
+import threading
+import httplib2
 import pytest
 import pytest_asyncio
 from unittest.mock import Mock, patch, AsyncMock
 from datetime import datetime, timedelta
 from app.email_agent import (
     ServiceAuthenticator,
+    complete_auth,
     get_threads,
     process_message,
     extract_meeting_details,
@@ -13,11 +18,31 @@ from app.email_agent import (
     resolve_conflicting_events,
     Message,
     Thread,
-    Threads,
     MeetingDetails,
     MeetingDetailsList,
-    get_threads_with_messages
+    get_threads_with_messages,
+    store_threads,
+    load_threads,
+    hydrate_threads,
+    screen_threads,
+    min_messages_rule,
+    iter_thread_pages,
+    chunk_threads,
+    merge_meeting_details,
+    fetch_conflicting_events_for_meeting,
+    group_overlapping_meetings
 )
+from googleapiclient.errors import HttpError
+from app.extraction_cache import ExtractionCache
+from app.meeting_ledger import MeetingLedger
+from app.inbox_sync import InboxSync, SyncCursorStore
+from app.blob_store import BlobStore
+from app.service_registry import ServiceRegistry, AccountServices
+from app.token_manager import TokenManager, expires_within
+from google.oauth2.credentials import Credentials
+from tests.test_token_manager import write_token_file, fake_refresh, utc_now
+from app.google_api import QuotaScheduler, GoogleIOPool, build_service
+from google.auth.credentials import AnonymousCredentials
 from langchain_core.messages import HumanMessage
 
 # At the top of the file, after imports
@@ -55,12 +80,31 @@ MOCK_MEETING_DETAILS = MeetingDetailsList(
     ]
 )
 
-@pytest.fixture
-def mock_credentials_file():
-    with patch('os.path.exists') as mock_exists:
-        mock_exists.return_value = False
+@pytest.fixture(autouse=True)
+def empty_extraction_cache():
+    with patch('app.email_agent.extraction_cache', ExtractionCache()):
         yield
 
+@pytest_asyncio.fixture(autouse=True)
+async def empty_meeting_ledger(tmp_path):
+    ledger = MeetingLedger(str(tmp_path / "ledger.db"))
+    with patch('app.email_agent.meeting_ledger', ledger):
+        yield ledger
+    await ledger.close()
+
+@pytest_asyncio.fixture(autouse=True)
+async def empty_blob_store(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs.db"))
+    with patch('app.email_agent.blob_store', store):
+        yield store
+    await store.close()
+
+def registry_with(gmail=None, calendar=None):
+    """Registry already holding the given clients for the default account."""
+    registry = ServiceRegistry(authenticator_factory=Mock())
+    registry.put("default", AccountServices(gmail=gmail, calendar=calendar))
+    return registry
+
 @pytest_asyncio.fixture
 async def mock_gmail_service():
     service = Mock()
@@ -110,17 +154,42 @@ async def mock_calendar_service():
     return service
 
 @pytest.mark.asyncio
-async def test_service_authenticator_initialization(mock_credentials_file):
-    with patch('app.email_agent.InstalledAppFlow') as mock_flow:
+async def test_service_authenticator_initialization(tmp_path):
+    token_path = tmp_path / "token.json"
+    with patch('app.email_agent.InstalledAppFlow') as mock_flow, patch('app.email_agent.token_manager', TokenManager([])):
         mock_flow.from_client_secrets_file.return_value = AsyncMock()
-        mock_flow.from_client_secrets_file.return_value.run_local_server_async.return_value = Mock(valid=True)
+        mock_flow.from_client_secrets_file.return_value.run_local_server_async.return_value = Mock(valid=True, to_json=Mock(return_value='{"token": "new"}'))
         
-        authenticator = ServiceAuthenticator()
+        authenticator = ServiceAuthenticator(token_path=str(token_path))
         try:
             creds = await authenticator.get_credentials()
             assert creds is not None
         except Exception as e:
             pytest.fail(f"get_credentials() raised {e} unexpectedly")
+    # Tokens obtained from a sign-in are stored for the next run
+    assert token_path.read_text() == '{"token": "new"}'
+
+@pytest.mark.asyncio
+async def test_accounts_served_from_the_registry_stay_warm(tmp_path):
+    manager = TokenManager([], refresh_margin=300, keep_warm=600)
+    token_path = tmp_path / "alice.json"
+    write_token_file(token_path, "alice", expires_in=3600)
+    registry = ServiceRegistry(authenticator_factory=Mock())
+    registry.put("alice", AccountServices(gmail=Mock(), calendar=Mock()))
+    calls = []
+
+    with patch('app.email_agent.token_manager', manager), patch('app.email_agent.service_registry', registry), \
+            patch('app.email_agent.GOOGLE_TOKEN_DIR', str(tmp_path)), patch.object(Credentials, "refresh", fake_refresh(calls)):
+        creds = await manager.get(str(token_path))
+        # Clients were built long ago, sessions since then were served from the registry
+        manager.used_at[str(token_path)] -= 3600
+        await complete_auth({}, {"configurable": {"user_id": "alice"}})
+        creds.expiry = utc_now() + timedelta(seconds=120)
+
+        await manager.refresh_expiring()
+
+    assert calls == ["alice"]
+    assert not expires_within(creds, 300)
 
 @pytest.mark.asyncio
 async def test_get_threads(mock_gmail_service):
@@ -141,7 +210,7 @@ async def test_process_message():
 @pytest.mark.asyncio
 async def test_extract_meeting_details():
     mock_state = {
-        "threads_with_messages": Threads(threads=[
+        "thread_refs": await store_threads([
             Thread(
                 thread_id="thread_123",
                 subject="Meeting Schedule",
@@ -158,8 +227,8 @@ async def test_extract_meeting_details():
         ])
     }
     
-    with patch('app.email_agent.llm_anthropic') as mock_llm:
-        mock_llm.with_structured_output.return_value.invoke.return_value = MOCK_MEETING_DETAILS
+    with patch('app.email_agent.llm') as mock_llm:
+        mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(return_value=MOCK_MEETING_DETAILS)
         result = await extract_meeting_details(mock_state)
         assert "meeting_details" in result
         assert len(result["meeting_details"].meetings) == 1
@@ -177,10 +246,18 @@ async def test_ensure_rfc3339():
     timestamp = "2024-04-25 14:00:00"
     timezone = "America/New_York"
     
-    with patch('app.email_agent.llm_anthropic') as mock_llm:
-        mock_llm.invoke.return_value.content = "2024-04-25T14:00:00-04:00"
+    with patch('app.email_agent.llm') as mock_llm:
+        mock_llm.ainvoke = AsyncMock()
         result = await ensure_rfc3339(timestamp, timezone)
         assert result == "2024-04-25T14:00:00-04:00"
+        mock_llm.ainvoke.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_ensure_rfc3339_falls_back_to_the_model():
+    with patch('app.email_agent.llm') as mock_llm:
+        mock_llm.ainvoke = AsyncMock(return_value=Mock(content="2024-04-30T14:00:00-04:00"))
+        result = await ensure_rfc3339("next Tuesday at 2pm", "America/New_York")
+        assert result == "2024-04-30T14:00:00-04:00"
 
 @pytest.mark.asyncio
 async def test_create_meeting_events(mock_calendar_service):
@@ -200,7 +277,7 @@ async def test_create_meeting_events(mock_calendar_service):
         }
     }
     
-    with patch('app.email_agent.calendar_service', mock_calendar_service):
+    with patch('app.email_agent.service_registry', registry_with(calendar=mock_calendar_service)):
         with patch('app.email_agent.ensure_rfc3339') as mock_ensure_rfc3339:
             mock_ensure_rfc3339.return_value = "2024-04-25T14:00:00-04:00"
             result = await create_meeting_events(mock_state)
@@ -234,11 +311,11 @@ async def test_resolve_conflicting_events():
         "resolution_input": HumanMessage(content="Schedule all events")
     }
     
-    with patch('app.email_agent.llm_anthropic') as mock_llm:
+    with patch('app.email_agent.llm') as mock_llm:
         mock_resolution = Mock()
         mock_resolution.resolved_events = MOCK_MEETING_DETAILS
         mock_resolution.resolution_description = "Conflicts resolved"
-        mock_llm.with_structured_output.return_value.invoke.return_value = mock_resolution
+        mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(return_value=mock_resolution)
         
         result = await resolve_conflicting_events(mock_state)
         assert "events_to_be_scheduled" in result
@@ -247,7 +324,7 @@ async def test_resolve_conflicting_events():
 
 @pytest.mark.asyncio
 async def test_get_threads_with_messages(mock_gmail_service):
-    with patch('app.email_agent.gmail_service', mock_gmail_service):
+    with patch('app.email_agent.service_registry', registry_with(gmail=mock_gmail_service)):
         # Mock the thread.get() response
         get_mock = Mock()
         get_mock.execute.return_value = {
@@ -296,15 +373,16 @@ async def test_get_threads_with_messages(mock_gmail_service):
         result = await get_threads_with_messages(input_state)
         
         # Verify the result
-        assert "threads_with_messages" in result
-        threads = result["threads_with_messages"].threads
+        assert "thread_refs" in result
+        assert [ref["thread_id"] for ref in result["thread_refs"]] == ["thread_123"]
+        threads = await load_threads(result["thread_refs"])
         assert len(threads) == 1
         assert threads[0].thread_id == "thread_123"
         assert len(threads[0].messages) == 3
 
 @pytest.mark.asyncio
 async def test_get_threads_with_messages_empty(mock_gmail_service):
-    with patch('app.email_agent.gmail_service', mock_gmail_service):
+    with patch('app.email_agent.service_registry', registry_with(gmail=mock_gmail_service)):
         # Mock empty threads.list response
         list_mock = Mock()
         list_mock.execute.return_value = {"threads": []}
@@ -312,12 +390,11 @@ async def test_get_threads_with_messages_empty(mock_gmail_service):
         
         input_state = {}
         result = await get_threads_with_messages(input_state)
-        assert "threads_with_messages" in result
-        assert len(result["threads_with_messages"].threads) == 0
+        assert result["thread_refs"] == []
 
 @pytest.mark.asyncio
 async def test_get_threads_with_messages_error(mock_gmail_service):
-    with patch('app.email_agent.gmail_service', mock_gmail_service):
+    with patch('app.email_agent.service_registry', registry_with(gmail=mock_gmail_service)):
         # Mock an error in threads.list
         list_mock = Mock()
         list_mock.execute.side_effect = Exception("API Error")
@@ -328,4 +405,441 @@ async def test_get_threads_with_messages_error(mock_gmail_service):
         # Test error handling
         with pytest.raises(Exception) as exc_info:
             await get_threads_with_messages(input_state)
-        assert "API Error" in str(exc_info.value) 
\ No newline at end of file
+        assert "API Error" in str(exc_info.value)
+
+@pytest.fixture
+def incremental_sync(tmp_path):
+    sync = InboxSync(SyncCursorStore(str(tmp_path / "sync_state.json")))
+    with patch('app.email_agent.GMAIL_INCREMENTAL_SYNC', True), patch('app.email_agent.inbox_sync', sync):
+        yield sync
+
+@pytest.mark.asyncio
+async def test_failed_resync_listing_keeps_the_cursor(mock_gmail_service, incremental_sync):
+    mock_gmail_service.users().getProfile().execute.return_value = {"emailAddress": "user@example.com", "historyId": "999"}
+    mock_gmail_service.users().threads().list().execute.side_effect = HttpError(Mock(status=400, reason="Bad Request"), b"error")
+
+    with patch('app.email_agent.service_registry', registry_with(gmail=mock_gmail_service)):
+        result = await get_threads_with_messages({})
+
+    assert "thread_refs" not in result
+    assert incremental_sync.store.get("user@example.com") is None
+
+@pytest.mark.asyncio
+async def test_failed_thread_fetch_keeps_the_cursor(mock_gmail_service, incremental_sync):
+    mock_gmail_service.users().getProfile().execute.return_value = {"emailAddress": "user@example.com", "historyId": "999"}
+    mock_gmail_service.users().threads().get().execute.side_effect = HttpError(Mock(status=404, reason="Not Found"), b"error")
+
+    with patch('app.email_agent.service_registry', registry_with(gmail=mock_gmail_service)):
+        result = await get_threads_with_messages({})
+
+    assert result["thread_refs"] == []
+    assert result["sync_cursor"] is None
+
+@pytest.mark.asyncio
+async def test_cursor_is_committed_once_extraction_succeeds(incremental_sync):
+    state = {
+        "thread_refs": await store_threads([make_thread("t1", "Can we meet Tuesday at 3pm?")]),
+        "sync_cursor": {"account": "user@example.com", "history_id": "999"}
+    }
+
+    with patch('app.email_agent.llm') as mock_llm:
+        mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(side_effect=Exception("Model unavailable"))
+        with pytest.raises(Exception):
+            await extract_meeting_details(state)
+        assert incremental_sync.store.get("user@example.com") is None
+
+        mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(return_value=MOCK_MEETING_DETAILS)
+        await extract_meeting_details(state)
+
+    assert incremental_sync.store.get("user@example.com") == "999"
+
+@pytest.mark.asyncio
+async def test_hydrate_threads_keeps_order_and_skips_failures():
+    service = Mock()
+    bad_request = Mock()
+    bad_request.execute.side_effect = HttpError(Mock(status=500, reason="Backend Error"), b"error")
+
+    def get_thread(userId, id, **params):
+        if id == "thread_bad":
+            return bad_request
+        request = Mock()
+        request.execute.return_value = {"id": id, "messages": []}
+        return request
+
+    service.users().threads().get = Mock(side_effect=get_thread)
+
+    threads = [{"id": "thread_1"}, {"id": "thread_bad"}, {"id": "thread_2"}]
+    with patch('app.google_api.quota_scheduler', QuotaScheduler(max_retries=2, base_delay=0)):
+        result = await hydrate_threads(service, threads, concurrency=2)
+
+    assert [tdata["id"] if tdata else None for tdata in result] == ["thread_1", None, "thread_2"]
+    # Server errors are retried before the thread is given up
+    assert bad_request.execute.call_count == 3
+
+@pytest.mark.asyncio
+async def test_hydrate_threads_never_shares_the_client_transport():
+    service = build_service("gmail", "v1", AnonymousCredentials())
+    used = []
+
+    def send(http, uri, method="GET", **kwargs):
+        time.sleep(0.01)
+        used.append((threading.get_ident(), http))
+        thread_id = uri.split("/threads/")[1].split("?")[0]
+        return httplib2.Response({"status": "200"}), json.dumps({"id": thread_id, "messages": []}).encode()
+
+    threads = [{"id": f"thread_{i}"} for i in range(20)]
+    with patch.object(httplib2.Http, "request", send), patch('app.google_api.google_io_pool', GoogleIOPool(max_workers=4)):
+        result = await hydrate_threads(service, threads, concurrency=10, mode="concurrent")
+
+    assert [tdata["id"] for tdata in result] == [thread["id"] for thread in threads]
+    transports = {}
+    for thread_ident, http in used:
+        assert http is not service._http.http
+        assert transports.setdefault(thread_ident, http) is http
+    assert len(set(map(id, transports.values()))) == len(transports) > 1
+
+
+@pytest.mark.asyncio
+async def test_screen_threads_fetches_full_data_only_for_eligible_threads():
+    service = Mock()
+    message_counts = {"thread_short": 1, "thread_long": 3}
+    full_fetches = []
+
+    def get_thread(userId, id, format, **params):
+        if format == "full":
+            full_fetches.append(id)
+        request = Mock()
+        request.execute.return_value = {
+            "id": id,
+            "historyId": "1",
+            "messages": [{"id": f"{id}_{i}"} for i in range(message_counts[id])]
+        }
+        return request
+
+    service.users().threads().get = Mock(side_effect=get_thread)
+
+    eligible, rejected = await screen_threads(
+        service, [{"id": "thread_short"}, {"id": "thread_long"}], rules=[min_messages_rule(3)]
+    )
+
+    assert [thread["id"] for thread, _ in eligible] == ["thread_long"]
+    assert [thread["id"] for thread, _ in rejected] == ["thread_short"]
+    assert full_fetches == ["thread_long"]
+
+
+@pytest.mark.asyncio
+async def test_iter_thread_pages_follows_page_tokens_up_to_the_cap():
+    service = Mock()
+    pages = {
+        None: {"threads": [{"id": "t1"}, {"id": "t2"}], "nextPageToken": "page_2"},
+        "page_2": {"threads": [{"id": "t3"}, {"id": "t4"}], "nextPageToken": "page_3"},
+        "page_3": {"threads": [{"id": "t5"}]}
+    }
+    calls = []
+
+    def list_threads(**params):
+        calls.append(params)
+        request = Mock()
+        request.execute.return_value = pages[params.get("pageToken")]
+        return request
+
+    service.users().threads().list = Mock(side_effect=list_threads)
+
+    result = [page async for page in iter_thread_pages(service, page_size=2, newer_than="7d", max_threads=3)]
+
+    assert result == [[{"id": "t1"}, {"id": "t2"}], [{"id": "t3"}, {"id": "t4"}]]
+    assert [call["maxResults"] for call in calls] == [2, 1]
+    assert all(call["q"] == "newer_than:7d" for call in calls)
+
+
+def make_thread(thread_id, body):
+    return Thread(
+        thread_id=thread_id,
+        subject="Subject",
+        messages=[Message(msg_id="msg_1", msg_body=body, from_="a@example.com", to=["b@example.com"], timestamp="")]
+    )
+
+@pytest.mark.asyncio
+async def test_chunk_threads_respects_token_budget():
+    threads = [make_thread("t1", "x" * 400), make_thread("t2", "x" * 400), make_thread("t3", "x" * 4000)]
+
+    chunks = chunk_threads(threads, token_budget=300)
+
+    assert [[thread.thread_id for thread in chunk] for chunk in chunks] == [["t1", "t2"], ["t3"]]
+
+@pytest.mark.asyncio
+async def test_merge_meeting_details_drops_duplicates():
+    duplicate = MOCK_MEETING_DETAILS.model_copy(deep=True)
+    duplicate.meetings[0].summary = "team meeting "
+    duplicate.meetings[0].start.dateTime = "2024-04-25T18:00:00Z"
+    duplicate.meetings[0].end.dateTime = "2024-04-25T19:00:00+00:00"
+    duplicate.meetings[0].attendees = ["user3@example.com"]
+
+    merged = merge_meeting_details([MOCK_MEETING_DETAILS, MeetingDetailsList(meetings="NONE"), duplicate])
+
+    assert len(merged.meetings) == 1
+    assert merged.meetings[0].attendees == ["user1@example.com", "user2@example.com", "user3@example.com"]
+    assert merge_meeting_details([MeetingDetailsList(meetings="NONE")]).meetings == "NONE"
+
+@pytest.mark.asyncio
+async def test_extract_meeting_details_runs_one_call_per_chunk():
+    threads = [make_thread(f"t{i}", "Can we meet Tuesday at 3pm? " + "x" * 4000) for i in range(3)]
+
+    with patch('app.email_agent.llm') as mock_llm, patch('app.email_agent.EXTRACTION_CHUNK_TOKENS', 1500):
+        mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(return_value=MOCK_MEETING_DETAILS)
+        result = await extract_meeting_details({"thread_refs": await store_threads(threads)})
+
+    assert mock_llm.with_structured_output.return_value.ainvoke.await_count == 3
+    assert len(result["meeting_details"].meetings) == 1
+
+
+@pytest.mark.asyncio
+async def test_extract_meeting_details_reuses_cached_threads():
+    upcoming = MOCK_MEETING_DETAILS.model_copy(deep=True)
+    upcoming.meetings[0].start.dateTime = (datetime.now() + timedelta(days=1)).isoformat(timespec="seconds")
+    upcoming.meetings[0].end.dateTime = (datetime.now() + timedelta(days=1, hours=1)).isoformat(timespec="seconds")
+    state = {"thread_refs": await store_threads([make_thread("t1", "Meet tomorrow?")])}
+
+    with patch('app.email_agent.llm') as mock_llm:
+        mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(return_value=upcoming)
+        first = await extract_meeting_details(state)
+        second = await extract_meeting_details(state)
+
+    assert mock_llm.with_structured_output.return_value.ainvoke.await_count == 1
+    assert second["meeting_details"].meetings[0].thread_id == "t1"
+    assert second["meeting_details"].meetings[0].summary == first["meeting_details"].meetings[0].summary
+
+@pytest.mark.asyncio
+async def test_extract_meeting_details_drops_cached_meetings_in_the_past():
+    state = {"thread_refs": await store_threads([make_thread("t1", "Meeting on April 25")])}
+
+    with patch('app.email_agent.llm') as mock_llm:
+        mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(return_value=MOCK_MEETING_DETAILS)
+        await extract_meeting_details(state)
+        result = await extract_meeting_details(state)
+
+    assert result["meeting_details"].meetings == "NONE"
+
+@pytest.mark.asyncio
+async def test_process_message_detects_calendar_invites():
+    message = {
+        "id": "msg_1",
+        "snippet": "Invitation: Design review",
+        "payload": {
+            "mimeType": "multipart/mixed",
+            "headers": [],
+            "parts": [
+                {"mimeType": "multipart/alternative", "parts": [{"mimeType": "text/plain"}]},
+                {"mimeType": "application/octet-stream", "filename": "invite.ics"}
+            ]
+        }
+    }
+
+    assert (await process_message(message))["has_calendar_invite"] is True
+    assert (await process_message(MOCK_THREAD["messages"][0]))["has_calendar_invite"] is False
+
+@pytest.mark.asyncio
+async def test_fetch_conflicting_events_uses_a_single_calendar_query(mock_calendar_service):
+    mock_calendar_service.events().list().execute.return_value = {"items": [
+        {"id": "e1", "summary": "Standup", "start": {"dateTime": "2024-04-25T14:30:00-04:00"}, "end": {"dateTime": "2024-04-25T14:45:00-04:00"}},
+        {"id": "e2", "summary": "Lunch", "start": {"dateTime": "2024-04-25T12:00:00-04:00"}, "end": {"dateTime": "2024-04-25T13:00:00-04:00"}}
+    ]}
+    mock_calendar_service.events().list.reset_mock()
+    meetings = [
+        {"summary": "Team Meeting", "start": {"dateTime": "2024-04-25T14:00:00", "timeZone": "America/New_York"}, "end": {"dateTime": "2024-04-25T15:00:00", "timeZone": "America/New_York"}},
+        {"summary": "Review", "start": {"dateTime": "2024-04-25T16:00:00", "timeZone": "America/New_York"}, "end": {"dateTime": "2024-04-25T17:00:00", "timeZone": "America/New_York"}}
+    ]
+
+    with patch('app.email_agent.service_registry', registry_with(calendar=mock_calendar_service)):
+        result = await fetch_conflicting_events_for_meeting({"events_to_be_scheduled": {"meetings": meetings}})
+
+    assert mock_calendar_service.events().list.call_count == 1
+    assert [event["summary"] for event in result["conflicting_events"][0]["existing_events"]] == ["Standup"]
+    assert result["conflicting_events"][1]["existing_events"] == []
+
+@pytest.mark.asyncio
+async def test_create_meeting_events_revalidates_the_conflict_snapshot(mock_calendar_service):
+    meeting = {
+        "summary": "Team Meeting",
+        "start": {"dateTime": "2024-04-25T14:00:00-04:00", "timeZone": "America/New_York"},
+        "end": {"dateTime": "2024-04-25T15:00:00-04:00", "timeZone": "America/New_York"},
+        "attendees": []
+    }
+    statuses = {"unchanged": 304, "deleted": 404}
+
+    def get_event(calendarId, eventId):
+        request = Mock()
+        request.headers = {}
+        request.execute.side_effect = HttpError(Mock(status=statuses[eventId], reason=""), b"")
+        return request
+
+    mock_calendar_service.events().get = Mock(side_effect=get_event)
+    mock_calendar_service.events().delete = Mock()
+    mock_calendar_service.events().list.reset_mock()
+    state = {
+        "events_to_be_scheduled": {"meetings": [meeting]},
+        "conflict_snapshot": {
+            "2024-04-25T14:00:00-04:00|2024-04-25T15:00:00-04:00": [
+                {"id": "unchanged", "etag": "\"1\"", "summary": "Standup"},
+                {"id": "deleted", "etag": "\"2\"", "summary": "Lunch"}
+            ]
+        }
+    }
+
+    with patch('app.email_agent.service_registry', registry_with(calendar=mock_calendar_service)):
+        result = await create_meeting_events(state)
+
+    assert len(result["meetings_scheduled"]) == 1
+    mock_calendar_service.events().list.assert_not_called()
+    mock_calendar_service.events().delete.assert_called_once_with(calendarId="primary", eventId="unchanged")
+
+@pytest.mark.asyncio
+async def test_a_meeting_never_conflicts_with_its_own_event(mock_calendar_service):
+    formatted = await format_meeting_details(MOCK_MEETING_DETAILS)
+    meeting = formatted["meetings"][0]
+    # Created by an earlier run that crashed before recording it in the ledger
+    own_event = {"id": meeting["id"], "summary": meeting["summary"], "start": meeting["start"], "end": meeting["end"]}
+    standup = {"id": "standup", "summary": "Standup", "start": meeting["start"], "end": meeting["end"]}
+    mock_calendar_service.events().list().execute.return_value = {"items": [own_event, standup]}
+    mock_calendar_service.events().delete = Mock()
+
+    with patch('app.email_agent.service_registry', registry_with(calendar=mock_calendar_service)):
+        conflicts = await fetch_conflicting_events_for_meeting({"events_to_be_scheduled": formatted})
+        await create_meeting_events({"events_to_be_scheduled": formatted})
+
+    assert [event["summary"] for event in conflicts["conflicting_events"][0]["existing_events"]] == ["Standup"]
+    assert [event["id"] for events in conflicts["conflict_snapshot"].values() for event in events] == ["standup"]
+    mock_calendar_service.events().delete.assert_called_once_with(calendarId="primary", eventId="standup")
+
+@pytest.mark.asyncio
+async def test_group_overlapping_meetings():
+    def window(start_hour, end_hour):
+        return (datetime(2024, 4, 25, start_hour), datetime(2024, 4, 25, end_hour))
+
+    windows = [window(9, 10), window(13, 14), window(9, 11), None, window(15, 16)]
+    conflicts = [[], [{"id": "shared"}], [], [], [{"id": "shared"}]]
+
+    assert group_overlapping_meetings(windows, conflicts) == [[0, 2], [1, 4], [3]]
+
+@pytest.mark.asyncio
+async def test_create_meeting_events_reports_failures_per_meeting(mock_calendar_service):
+    def meeting(summary, start_hour):
+        return {
+            "summary": summary,
+            "start": {"dateTime": f"2024-04-25T{start_hour}:00:00-04:00", "timeZone": "America/New_York"},
+            "end": {"dateTime": f"2024-04-25T{start_hour}:30:00-04:00", "timeZone": "America/New_York"},
+            "attendees": []
+        }
+
+    created = mock_calendar_service.events().insert().execute.return_value
+
+    def insert_event(calendarId, body, conferenceDataVersion, sendUpdates):
+        request = Mock()
+        if body["summary"] == "Broken":
+            request.execute.side_effect = HttpError(Mock(status=400, reason="Bad Request"), b"invalid")
+        else:
+            request.execute.return_value = {**created, "summary": body["summary"]}
+        return request
+
+    mock_calendar_service.events().insert = Mock(side_effect=insert_event)
+    state = {"events_to_be_scheduled": {"meetings": [meeting("First", 10), meeting("Broken", 11), meeting("Third", 12)]}}
+
+    with patch('app.email_agent.service_registry', registry_with(calendar=mock_calendar_service)):
+        result = await create_meeting_events(state)
+
+    assert [meeting["summary"] for meeting in result["meetings_scheduled"]] == ["First", "Third"]
+    assert result["meetings_failed"][0]["summary"] == "Broken"
+
+
+@pytest.mark.asyncio
+async def test_format_meeting_details_derives_stable_event_ids():
+    first = await format_meeting_details(MOCK_MEETING_DETAILS)
+    second = await format_meeting_details(MOCK_MEETING_DETAILS)
+    moved = MOCK_MEETING_DETAILS.model_copy(deep=True)
+    moved.meetings[0].start.dateTime = "2024-04-25T16:00:00-04:00"
+
+    event_id = first["meetings"][0]["id"]
+    assert event_id == second["meetings"][0]["id"]
+    assert event_id != (await format_meeting_details(moved))["meetings"][0]["id"]
+    assert first["meetings"][0]["conferenceData"]["createRequest"]["requestId"] == event_id
+
+@pytest.mark.asyncio
+async def test_create_meeting_events_skips_meetings_already_committed(mock_calendar_service):
+    formatted = await format_meeting_details(MOCK_MEETING_DETAILS)
+    state = {"events_to_be_scheduled": formatted}
+
+    with patch('app.email_agent.service_registry', registry_with(calendar=mock_calendar_service)):
+        first = await create_meeting_events(state)
+        mock_calendar_service.events().insert.reset_mock()
+        replay = await create_meeting_events(state)
+
+    mock_calendar_service.events().insert.assert_not_called()
+    assert replay["meetings_scheduled"] == first["meetings_scheduled"]
+
+@pytest.mark.asyncio
+async def test_meetings_committed_by_one_account_are_scheduled_for_another(mock_calendar_service):
+    formatted = await format_meeting_details(MOCK_MEETING_DETAILS)
+    state = {"events_to_be_scheduled": formatted}
+    registry = registry_with(calendar=mock_calendar_service)
+    registry.put("bob", AccountServices(gmail=None, calendar=mock_calendar_service))
+
+    with patch('app.email_agent.service_registry', registry):
+        await create_meeting_events(state)
+        mock_calendar_service.events().insert.reset_mock()
+        await create_meeting_events(state, {"configurable": {"user_id": "bob"}})
+
+    mock_calendar_service.events().insert.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_create_meeting_events_reuses_an_event_with_the_same_id(mock_calendar_service):
+    formatted = await format_meeting_details(MOCK_MEETING_DETAILS)
+    existing = mock_calendar_service.events().insert().execute.return_value
+    mock_calendar_service.events().insert().execute.side_effect = HttpError(Mock(status=409, reason="Conflict"), b"duplicate")
+    mock_calendar_service.events().get().execute.return_value = existing
+
+    with patch('app.email_agent.service_registry', registry_with(calendar=mock_calendar_service)):
+        result = await create_meeting_events({"events_to_be_scheduled": formatted})
+
+    assert result["meetings_failed"] == []
+    assert result["meetings_scheduled"][0]["summary"] == "Team Meeting"
+
+@pytest.mark.asyncio
+async def test_sqlite_checkpointer_is_shared_through_the_file(tmp_path):
+    from app.email_agent import get_email_agent
+
+    with patch('app.email_agent.CHECKPOINTER_PATH', str(tmp_path / "checkpoints.db")):
+        first_worker = await get_email_agent("sqlite")
+        second_worker = await get_email_agent("sqlite")
+
+    config = {"configurable": {"thread_id": "session_1"}}
+    await first_worker.aupdate_state(config, {"resolution_output": "saved"}, as_node="create_meeting_events")
+    state = await second_worker.aget_state(config)
+
+    assert state.values["resolution_output"] == "saved"
+    journal_mode = await (await first_worker.checkpointer.conn.execute("PRAGMA journal_mode")).fetchone()
+    assert journal_mode[0] == "wal"
+    await first_worker.checkpointer.conn.close()
+    await second_worker.checkpointer.conn.close()
+
+@pytest.mark.asyncio
+async def test_thread_refs_are_content_addressed(empty_blob_store):
+    thread = make_thread("t1", "Meet tomorrow at 3pm?")
+
+    first = await store_threads([thread])
+    second = await store_threads([thread, make_thread("t2", "Lunch on Friday?")])
+
+    assert first[0] == second[0]
+    assert first[0]["digest"] != second[1]["digest"]
+    assert len(await empty_blob_store.get_many([ref["digest"] for ref in second])) == 2
+    assert await load_threads(second) == [thread, make_thread("t2", "Lunch on Friday?")]
+
+async def test_token_paths_are_per_account():
+    from app.email_agent import token_path_for, user_id_of
+
+    assert token_path_for("default") == "token.json"
+    assert token_path_for("alice@example.com").endswith("alice@example.com.json")
+    for user_id in ["../token", "a/b", "", ".hidden"]:
+        with pytest.raises(ValueError):
+            token_path_for(user_id)
+    assert user_id_of({"configurable": {"thread_id": "t", "user_id": "alice"}}) == "alice"
+    assert user_id_of(None) == "default"
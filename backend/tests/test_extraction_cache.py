@@ -0,0 +1,38 @@
+from unittest.mock import patch
+from app.extraction_cache import ExtractionCache, thread_content_hash
+from app.email_agent import Thread, Message
+
+
+def make_thread(body):
+    return Thread(
+        thread_id="thread_1",
+        subject="Subject",
+        messages=[Message(msg_id="msg_1", msg_body=body, from_="a@example.com", to=["b@example.com"], timestamp="")]
+    )
+
+
+def test_thread_content_hash_changes_with_content():
+    assert thread_content_hash(make_thread("hello")) == thread_content_hash(make_thread("hello"))
+    assert thread_content_hash(make_thread("hello")) != thread_content_hash(make_thread("hello again"))
+
+
+def test_entries_expire_after_ttl():
+    cache = ExtractionCache(ttl_seconds=60)
+    with patch("app.extraction_cache.time.time", return_value=1000):
+        cache.put("key", ["meeting"])
+    with patch("app.extraction_cache.time.time", return_value=1030):
+        assert cache.get("key") == ["meeting"]
+    with patch("app.extraction_cache.time.time", return_value=1061):
+        assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ExtractionCache(max_entries=2)
+    cache.put("a", [])
+    cache.put("b", [])
+    cache.get("a")
+    cache.put("c", [])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == []
+    assert cache.get("c") == []
@@ -0,0 +1,35 @@
+from app.gmail_query import ThreadQuery
+
+
+def test_empty_query_compiles_to_no_parameters():
+    assert ThreadQuery().compile() == {}
+
+
+def test_query_compiles_to_q_and_label_ids():
+    query = ThreadQuery(
+        label_ids=["INBOX"],
+        exclude_categories=["promotions", "social"],
+        newer_than="14d",
+        allow_senders=["boss@example.com", "example.org"],
+        deny_senders=["noreply@example.com"],
+        keywords=["meet", "call", "calendar invite"]
+    )
+
+    assert query.compile() == {
+        "q": (
+            "newer_than:14d -category:promotions -category:social "
+            "from:(boss@example.com OR example.org) -from:noreply@example.com "
+            '(meet OR call OR "calendar invite")'
+        ),
+        "labelIds": ["INBOX"]
+    }
+
+
+def test_query_from_env(monkeypatch):
+    monkeypatch.setenv("GMAIL_QUERY_EXCLUDE_CATEGORIES", "promotions, social")
+    monkeypatch.setenv("GMAIL_QUERY_KEYWORDS", "meet")
+
+    query = ThreadQuery.from_env()
+
+    assert query.exclude_categories == ["promotions", "social"]
+    assert query.to_q() == "-category:promotions -category:social meet"
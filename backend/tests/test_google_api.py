@@ -0,0 +1,175 @@
+import time
+import asyncio
+import threading
+import httplib2
+import pytest
+from unittest.mock import Mock, patch
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
+from google.auth.credentials import AnonymousCredentials
+from app.google_api import execute_batch, execute_request, build_service, discovery_document, GoogleIOPool, QuotaScheduler, quota_cost, quota_api
+
+pytestmark = pytest.mark.asyncio
+
+
+def http_error(status):
+    return HttpError(Mock(status=status, reason="error"), b"error")
+
+
+class FakeBatch:
+    """Minimal stand-in for BatchHttpRequest that answers through a handler."""
+
+    def __init__(self, callback, handler, sizes):
+        self.callback = callback
+        self.handler = handler
+        self.sizes = sizes
+        self.requests = {}
+
+    def add(self, request, request_id):
+        self.requests[request_id] = request
+
+    def execute(self):
+        self.sizes.append(len(self.requests))
+        if len(self.requests) > 2:
+            raise http_error(413)
+        for request_id, request in self.requests.items():
+            response, exception = self.handler(request)
+            self.callback(request_id, response, exception)
+
+
+def fake_service(handler, sizes):
+    service = Mock()
+    service.new_batch_http_request = lambda callback: FakeBatch(callback, handler, sizes)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_splits_rejected_batches():
+    sizes = []
+    service = fake_service(lambda request: (request, None), sizes)
+
+    result = await execute_batch(service, ["a", "b", "c", "d"], batch_size=4)
+
+    assert result == ["a", "b", "c", "d"]
+    assert sizes == [4, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_retries_only_failed_requests():
+    sent = []
+    failures = {"b": [http_error(503)], "c": [http_error(404)]}
+
+    def handler(request):
+        sent.append(request)
+        if failures.get(request):
+            return None, failures[request].pop()
+        return request, None
+
+    service = fake_service(handler, [])
+    result = await execute_batch(service, ["a", "b", "c"], batch_size=2, retry_delay=0)
+
+    assert result[0] == "a"
+    assert result[1] == "b"
+    assert isinstance(result[2], HttpError)
+    assert sent == ["a", "b", "c", "b"]
+
+
+async def test_clients_are_built_from_the_cached_discovery_document():
+    discovery_document.cache_clear()
+    first = build_service("gmail", "v1", AnonymousCredentials())
+    second = build_service("gmail", "v1", AnonymousCredentials())
+
+    assert discovery_document.cache_info().misses == 1
+    assert discovery_document.cache_info().hits == 1
+    assert first is not second
+    assert first.users().threads().list(userId="me").uri.startswith("https://gmail.googleapis.com/gmail/v1/users/me/threads")
+
+
+async def test_requests_run_on_per_thread_transports():
+    pool = GoogleIOPool(max_workers=4)
+    credentials = AnonymousCredentials()
+    shared = AuthorizedHttp(credentials)
+    used = []
+
+    def execute(http=None):
+        time.sleep(0.01)
+        used.append((threading.get_ident(), http))
+        return "ok"
+
+    requests = [Mock(http=shared, execute=execute) for _ in range(20)]
+    with patch("app.google_api.google_io_pool", pool):
+        assert await asyncio.gather(*(execute_request(request) for request in requests)) == ["ok"] * 20
+
+    transports = {}
+    for thread_id, http in used:
+        assert http is not shared and http.credentials is credentials
+        assert transports.setdefault(thread_id, http) is http
+    assert len(set(map(id, transports.values()))) == len(transports) > 1
+    assert pool.metrics() == {"workers": 4, "queued": 0, "running": 0, "completed": 20}
+
+
+def rate_limited_error():
+    content = b'{"error": {"code": 403, "message": "Rate Limit Exceeded", "errors": [{"reason": "rateLimitExceeded"}]}}'
+    return HttpError(Mock(status=403, reason="Forbidden"), content)
+
+
+async def test_quota_costs_follow_the_method():
+    gmail = build_service("gmail", "v1", AnonymousCredentials())
+    calendar = build_service("calendar", "v3", AnonymousCredentials())
+    batch = gmail.new_batch_http_request()
+    batch.add(gmail.users().threads().get(userId="me", id="t1"))
+    batch.add(gmail.users().history().list(userId="me", startHistoryId="1"))
+
+    assert quota_cost(gmail.users().threads().list(userId="me")) == 10
+    assert quota_cost(calendar.events().insert(calendarId="primary", body={})) == 1
+    assert quota_cost(batch) == 12
+    assert quota_api(batch) == "gmail"
+
+
+async def test_rate_limited_calls_are_retried_and_others_are_not():
+    scheduler = QuotaScheduler(base_delay=0)
+    attempts = []
+
+    async def call(errors):
+        attempts.append(len(errors))
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    retried = [http_error(503), http_error(429), rate_limited_error()]
+    assert await scheduler.run(Mock(), None, lambda: call(retried)) == "ok"
+    assert attempts == [3, 2, 1, 0]
+
+    with pytest.raises(HttpError):
+        await scheduler.run(Mock(), None, lambda: call([http_error(403)]))
+    assert attempts[-1] == 1
+
+
+async def test_quota_is_enforced_per_user():
+    scheduler = QuotaScheduler(limits={"gmail": (20, 1000)})
+    gmail = build_service("gmail", "v1", AnonymousCredentials())
+    busy, other = AuthorizedHttp(AnonymousCredentials()), AuthorizedHttp(AnonymousCredentials())
+    request = gmail.users().threads().get(userId="me", id="t1")
+    loop = asyncio.get_event_loop()
+
+    async def answer():
+        return loop.time()
+
+    start = loop.time()
+    finished = [await scheduler.run(request, busy, answer) for _ in range(3)]
+    other_finished = await scheduler.run(request, other, answer)
+
+    # 20 units per second: the third 10-unit call of the busy user waits half a second
+    assert finished[1] - start < 0.1
+    assert finished[2] - start >= 0.45
+    assert other_finished - finished[2] < 0.1
+
+
+async def test_clients_without_credentials_get_per_thread_transports():
+    pool = GoogleIOPool(max_workers=2)
+    shared = httplib2.Http()
+
+    first = await pool.run(Mock(execute=lambda http=None: http), shared)
+    second = await pool.run(Mock(execute=lambda http=None: http), shared)
+
+    assert first is not shared and second is not shared
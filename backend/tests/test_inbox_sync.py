@@ -0,0 +1,148 @@
+import pytest
+from unittest.mock import Mock
+from googleapiclient.errors import HttpError
+from app.inbox_sync import InboxSync, SyncCursorStore
+
+pytestmark = pytest.mark.asyncio
+
+
+def gmail_service(history_response=None, history_error=None):
+    service = Mock()
+    service.users().getProfile().execute.return_value = {
+        "emailAddress": "user@example.com",
+        "historyId": "200"
+    }
+    history_list = Mock()
+    if history_error is not None:
+        history_list.execute.side_effect = history_error
+    else:
+        history_list.execute.return_value = history_response
+    service.users().history().list = Mock(return_value=history_list)
+    return service
+
+
+async def list_all_threads(service, max_threads=None):
+    yield [{"id": "thread_1"}, {"id": "thread_2"}]
+
+
+def listing(threads, page_size=2):
+    """Stands in for the thread query listing, yielding pages and recording the pages read."""
+    async def list_pages(service, max_threads=None):
+        stubs = [thread if isinstance(thread, dict) else {"id": thread} for thread in threads][:max_threads]
+        for start in range(0, len(stubs), page_size):
+            list_pages.pages += 1
+            yield stubs[start:start + page_size]
+    list_pages.pages = 0
+    return list_pages
+
+
+@pytest.mark.asyncio
+async def test_first_sync_lists_all_threads(tmp_path):
+    sync = InboxSync(SyncCursorStore(str(tmp_path / "state.json")))
+
+    threads, account, history_id = await sync.changed_threads(gmail_service(), list_all_threads)
+    sync.commit(account, history_id)
+
+    assert threads == [{"id": "thread_1"}, {"id": "thread_2"}]
+    assert sync.store.get("user@example.com") == "200"
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_returns_changed_threads(tmp_path):
+    store = SyncCursorStore(str(tmp_path / "state.json"))
+    store.set("user@example.com", "100")
+    service = gmail_service({
+        "historyId": "250",
+        "history": [
+            {"messagesAdded": [{"message": {"id": "m1", "threadId": "thread_a", "labelIds": ["INBOX"]}}]},
+            {"messagesAdded": [{"message": {"id": "m2", "threadId": "thread_b", "labelIds": ["SPAM"]}}]},
+            {"messagesAdded": [{"message": {"id": "m3", "threadId": "thread_c", "labelIds": ["INBOX"]}}]},
+            {"messagesAdded": [{"message": {"id": "m4", "threadId": "thread_a", "labelIds": ["INBOX"]}}]}
+        ]
+    })
+
+    threads, account, history_id = await InboxSync(store).changed_threads(service, listing(["thread_c", "thread_a", "thread_x"]))
+
+    assert threads == [{"id": "thread_c"}, {"id": "thread_a"}]
+    assert history_id == "250"
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_applies_the_thread_query_and_cap(tmp_path):
+    store = SyncCursorStore(str(tmp_path / "state.json"))
+    store.set("user@example.com", "100")
+    service = gmail_service({
+        "historyId": "250",
+        "history": [
+            {"messagesAdded": [{"message": {"id": f"m{i}", "threadId": f"thread_{i}", "labelIds": ["INBOX"]}}]}
+            for i in range(5)
+        ]
+    })
+    # thread_3 is a promotion the query leaves out
+    list_pages = listing(["thread_4", "thread_2", "thread_1", "thread_0", "thread_old"])
+
+    threads, _, history_id = await InboxSync(store).changed_threads(service, list_pages, label_id="INBOX", max_threads=3)
+
+    assert threads == [{"id": "thread_4"}, {"id": "thread_2"}, {"id": "thread_1"}]
+    assert history_id == "250"
+    assert service.users().history().list.call_args.kwargs["labelId"] == "INBOX"
+
+
+@pytest.mark.asyncio
+async def test_unchanged_threads_ranked_first_do_not_push_changed_ones_out(tmp_path):
+    store = SyncCursorStore(str(tmp_path / "state.json"))
+    store.set("user@example.com", "100")
+    service = gmail_service({
+        "historyId": "250",
+        "history": [
+            {"messagesAdded": [{"message": {"id": "m1", "threadId": "thread_a", "labelIds": ["INBOX"]}}]},
+            {"messagesAdded": [{"message": {"id": "m2", "threadId": "thread_b", "labelIds": ["INBOX"]}}]}
+        ]
+    })
+    # The user just replied on thread_reply, whose SENT message history.list does not count,
+    # and thread_promo is a promotion the query leaves out
+    service.users().history().list().execute.return_value["history"].append(
+        {"messagesAdded": [{"message": {"id": "m3", "threadId": "thread_promo", "labelIds": ["INBOX"]}}]}
+    )
+    list_pages = listing([
+        {"id": "thread_reply", "historyId": "240"},
+        {"id": "thread_b", "historyId": "230"},
+        {"id": "thread_a", "historyId": "210"},
+        {"id": "thread_old", "historyId": "90"},
+        {"id": "thread_older", "historyId": "80"},
+    ])
+
+    threads, _, history_id = await InboxSync(store).changed_threads(service, list_pages, max_threads=5)
+
+    assert [thread["id"] for thread in threads] == ["thread_b", "thread_a"]
+    # Listing stopped at a thread unchanged since the cursor, so thread_promo is excluded by the query
+    assert list_pages.pages == 2
+    assert history_id == "250"
+
+
+@pytest.mark.asyncio
+async def test_cursor_is_kept_when_changed_threads_are_beyond_the_scan(tmp_path):
+    store = SyncCursorStore(str(tmp_path / "state.json"))
+    store.set("user@example.com", "100")
+    service = gmail_service({
+        "historyId": "250",
+        "history": [{"messagesAdded": [{"message": {"id": "m1", "threadId": "thread_a", "labelIds": ["INBOX"]}}]}]
+    })
+    list_pages = listing([{"id": f"thread_new_{i}", "historyId": "200"} for i in range(4)] + ["thread_a"])
+
+    threads, _, history_id = await InboxSync(store, scan_limit=4).changed_threads(service, list_pages, max_threads=5)
+
+    assert threads == []
+    assert history_id is None
+
+
+@pytest.mark.asyncio
+async def test_expired_cursor_falls_back_to_full_resync(tmp_path):
+    store = SyncCursorStore(str(tmp_path / "state.json"))
+    store.set("user@example.com", "1")
+    service = gmail_service(history_error=HttpError(Mock(status=404, reason="Not Found"), b"error"))
+
+    threads, account, history_id = await InboxSync(store).changed_threads(service, list_all_threads)
+
+    assert threads == [{"id": "thread_1"}, {"id": "thread_2"}]
+    assert history_id == "200"
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from unittest.mock import Mock, AsyncMock
+from app.llm_gateway import LLMGateway, TokenBucket
+
+pytestmark = pytest.mark.asyncio
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+@pytest.mark.asyncio
+async def test_retries_rate_limited_calls():
+    model = Mock()
+    model.ainvoke = AsyncMock(side_effect=[StatusError(429), StatusError(503), "response"])
+    gateway = LLMGateway(max_retries=3, base_delay=0)
+
+    assert await gateway.ainvoke(model, ["message"]) == "response"
+    assert model.ainvoke.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_client_errors():
+    model = Mock()
+    model.ainvoke = AsyncMock(side_effect=StatusError(400))
+    gateway = LLMGateway(max_retries=3, base_delay=0)
+
+    with pytest.raises(StatusError):
+        await gateway.ainvoke(model, ["message"])
+    assert model.ainvoke.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_times_out_slow_calls():
+    async def slow(messages):
+        await asyncio.sleep(1)
+
+    model = Mock()
+    model.ainvoke = slow
+    gateway = LLMGateway(max_retries=0, timeout=0.01)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await gateway.ainvoke(model, ["message"])
+
+
+@pytest.mark.asyncio
+async def test_structured_output_is_requested_from_the_model():
+    model = Mock()
+    model.with_structured_output.return_value.ainvoke = AsyncMock(return_value="parsed")
+    gateway = LLMGateway()
+
+    assert await gateway.ainvoke(model, ["message"], structured_output=dict) == "parsed"
+    model.with_structured_output.assert_called_once_with(dict)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=1)
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    for _ in range(4):
+        await bucket.acquire()
+    assert loop.time() - start >= 0.025
@@ -0,0 +1,57 @@
+import json
+import os
+from app.email_agent import Thread, Message
+from app.prefilter import prefilter_threads, scheduling_score
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "prefilter_threads.json")
+
+
+def load_labeled_threads():
+    with open(FIXTURES_PATH) as f:
+        fixtures = json.load(f)
+    labeled = []
+    for fixture in fixtures:
+        messages = [
+            Message(
+                msg_id=f"{fixture['thread_id']}_{index}",
+                msg_body=body,
+                from_="sender@example.com",
+                to=["recipient@example.com"],
+                timestamp="Thu, 25 Apr 2024 10:00:00 -0400",
+                has_calendar_invite=fixture.get("has_calendar_invite", False)
+            )
+            for index, body in enumerate(fixture["bodies"])
+        ]
+        thread = Thread(thread_id=fixture["thread_id"], subject=fixture["subject"], messages=messages)
+        labeled.append((thread, fixture["scheduling"]))
+    return labeled
+
+
+def test_prefilter_keeps_every_scheduling_thread():
+    labeled = load_labeled_threads()
+    kept, dropped = prefilter_threads([thread for thread, _ in labeled])
+
+    kept_ids = {thread.thread_id for thread in kept}
+    scheduling_ids = {thread.thread_id for thread, scheduling in labeled if scheduling}
+    other_ids = {thread.thread_id for thread, scheduling in labeled if not scheduling}
+
+    assert scheduling_ids <= kept_ids
+    assert len(other_ids - kept_ids) >= len(other_ids) * 0.75
+
+
+def test_calendar_invite_always_passes():
+    thread = Thread(thread_id="t1", subject="", messages=[
+        Message(msg_id="m1", msg_body="", from_="a@example.com", to=[], timestamp="", has_calendar_invite=True)
+    ])
+
+    assert scheduling_score(thread) == 1.0
+
+
+def test_single_meeting_word_passes_the_default_threshold():
+    thread = Thread(thread_id="t1", subject="Hi", messages=[
+        Message(msg_id="m1", msg_body="Coffee?", from_="a@example.com", to=[], timestamp="")
+    ])
+
+    kept, _ = prefilter_threads([thread])
+
+    assert kept == [thread]
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from unittest.mock import Mock
+from app.service_registry import ServiceRegistry, AccountServices
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeAuthenticator:
+    """Builds clients tagged with the user id, after a short delay like a token refresh."""
+
+    def __init__(self, user_id, calls):
+        self.user_id = user_id
+        self.calls = calls
+
+    async def get_gmail_service(self):
+        self.calls.append(self.user_id)
+        await asyncio.sleep(0.01)
+        return f"gmail:{self.user_id}"
+
+    async def get_calendar_service(self):
+        return f"calendar:{self.user_id}"
+
+
+def registry(max_accounts=10):
+    calls = []
+    return ServiceRegistry(lambda user_id: FakeAuthenticator(user_id, calls), max_accounts=max_accounts), calls
+
+
+async def test_each_account_gets_its_own_clients():
+    services, _ = registry()
+
+    alice, bob = await asyncio.gather(services.get("alice"), services.get("bob"))
+
+    assert alice == AccountServices(gmail="gmail:alice", calendar="calendar:alice")
+    assert bob == AccountServices(gmail="gmail:bob", calendar="calendar:bob")
+
+
+async def test_concurrent_requests_share_one_authentication():
+    services, calls = registry()
+
+    results = await asyncio.gather(*(services.get("alice") for _ in range(5)))
+
+    assert calls == ["alice"]
+    assert all(result is results[0] for result in results)
+
+
+async def test_least_recently_used_accounts_are_evicted():
+    services, calls = registry(max_accounts=2)
+
+    await services.get("alice")
+    await services.get("bob")
+    await services.get("alice")
+    await services.get("carol")
+
+    assert set(services.entries) == {"alice", "carol"}
+    await services.get("bob")
+    assert calls == ["alice", "bob", "carol", "bob"]
+
+
+async def test_put_registers_clients_without_authenticating():
+    factory = Mock()
+    services = ServiceRegistry(factory)
+    services.put("alice", AccountServices(gmail="gmail", calendar="calendar"))
+
+    assert (await services.get("alice")).gmail == "gmail"
+    factory.assert_not_called()
+    services.evict("alice")
+    assert len(services) == 0
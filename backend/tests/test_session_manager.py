@@ -0,0 +1,89 @@
+import time
+import pytest
+import pytest_asyncio
+from langgraph.graph import StateGraph, MessagesState, START, END
+from app.email_agent import get_memory
+from app.session_manager import SessionManager
+
+pytestmark = pytest.mark.asyncio
+
+
+def build_graph(memory):
+    """Two-step graph that stops before its second node, like the agent does before resolution."""
+    builder = StateGraph(MessagesState)
+    builder.add_node("first", lambda state: {"messages": ["first"]})
+    builder.add_node("second", lambda state: {"messages": ["second"]})
+    builder.add_edge(START, "first")
+    builder.add_edge("first", "second")
+    builder.add_edge("second", END)
+    return builder.compile(checkpointer=memory, interrupt_before=["second"])
+
+
+@pytest_asyncio.fixture
+async def session_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.email_agent.CHECKPOINTER_PATH", str(tmp_path / "checkpoints.db"))
+    memory = await get_memory("sqlite")
+    manager = SessionManager(memory, ttl=60)
+    await manager.setup()
+    yield manager
+    await manager.stop()
+    await memory.conn.close()
+
+
+async def checkpoint_count(manager, thread_id):
+    (count,), = await manager._execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,), fetch=True)
+    return count
+
+
+async def test_settle_prunes_finished_sessions_to_their_latest_checkpoint(session_manager):
+    graph = build_graph(session_manager.checkpointer)
+    config = {"configurable": {"thread_id": "session_1"}}
+
+    await graph.ainvoke({"messages": ["start"]}, config)
+    assert await session_manager.settle(graph, config) is False
+    interrupted_checkpoints = await checkpoint_count(session_manager, "session_1")
+
+    await graph.ainvoke(None, config)
+    assert await session_manager.settle(graph, config) is True
+
+    assert interrupted_checkpoints > 1
+    assert await checkpoint_count(session_manager, "session_1") == 1
+    state = await graph.aget_state(config)
+    assert [message.content for message in state.values["messages"]] == ["start", "first", "second"]
+    metrics = await session_manager.metrics()
+    assert metrics["live_sessions"] == 0
+    assert metrics["finished_sessions"] == 1
+    assert metrics["checkpoints"] == 1
+    assert metrics["store_bytes"] > 0
+
+
+async def test_expire_deletes_sessions_past_their_ttl(session_manager):
+    graph = build_graph(session_manager.checkpointer)
+    for thread_id in ["abandoned", "active"]:
+        config = {"configurable": {"thread_id": thread_id}}
+        await graph.ainvoke({"messages": ["start"]}, config)
+        await session_manager.settle(graph, config)
+    await session_manager._execute(
+        "UPDATE sessions SET touched_at = ? WHERE thread_id = ?", (time.time() - 120, "abandoned")
+    )
+
+    assert await session_manager.expire() == 1
+
+    assert await checkpoint_count(session_manager, "abandoned") == 0
+    assert await checkpoint_count(session_manager, "active") > 0
+    assert (await session_manager.metrics())["live_sessions"] == 1
+
+
+async def test_expire_adopts_checkpoints_without_a_session(session_manager):
+    graph = build_graph(session_manager.checkpointer)
+    # A worker that died mid-run never settled its session
+    await graph.ainvoke({"messages": ["start"]}, {"configurable": {"thread_id": "orphan"}})
+
+    assert await session_manager.expire() == 0
+    assert (await session_manager.metrics())["live_sessions"] == 1
+
+    await session_manager._execute(
+        "UPDATE sessions SET touched_at = ? WHERE thread_id = ?", (time.time() - 120, "orphan")
+    )
+    assert await session_manager.expire() == 1
+    assert await checkpoint_count(session_manager, "orphan") == 0
@@ -0,0 +1,49 @@
+import time
+import pytest
+import pytest_asyncio
+from app.thread_store import ThreadStore, NOT_QUALIFIED
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def store(tmp_path):
+    store = ThreadStore(path=str(tmp_path / "threads.db"), max_bytes=1000, max_age_days=1)
+    yield store
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_get_many_is_invalidated_by_history_id(store):
+    await store.put_many([
+        ("thread_1", "10", '{"thread_id": "thread_1"}'),
+        ("thread_2", "20", NOT_QUALIFIED)
+    ])
+
+    found = await store.get_many([
+        {"id": "thread_1", "historyId": "10"},
+        {"id": "thread_2", "historyId": "20"},
+        {"id": "thread_3", "historyId": "30"}
+    ])
+    assert found == {"thread_1": '{"thread_id": "thread_1"}', "thread_2": NOT_QUALIFIED}
+
+    found = await store.get_many([{"id": "thread_1", "historyId": "11"}, {"id": "thread_2"}])
+    assert found == {}
+
+
+@pytest.mark.asyncio
+async def test_evicts_least_recently_used_over_size(store):
+    await store.put_many([("thread_old", "1", "x" * 600)])
+    await store.put_many([("thread_new", "1", "y" * 600)])
+
+    found = await store.get_many([{"id": "thread_old", "historyId": "1"}, {"id": "thread_new", "historyId": "1"}])
+    assert list(found) == ["thread_new"]
+
+
+@pytest.mark.asyncio
+async def test_evicts_expired_entries(store):
+    await store.put_many([("thread_1", "1", "payload")])
+    await store.conn.execute("UPDATE threads SET stored_at = ?", (time.time() - 2 * 24 * 60 * 60,))
+    await store.evict()
+
+    assert await store.get_many([{"id": "thread_1", "historyId": "1"}]) == {}
@@ -0,0 +1,21 @@
+import pytest
+from app.timestamps import normalize_rfc3339
+
+
+@pytest.mark.parametrize("timestamp, timezone, expected", [
+    ("2024-04-25 14:00:00", "America/New_York", "2024-04-25T14:00:00-04:00"),
+    ("2024-01-15T09:30:00", "Europe/Berlin", "2024-01-15T09:30:00+01:00"),
+    ("2024-04-25T14:00:00-07:00", "America/New_York", "2024-04-25T14:00:00-07:00"),
+    ("2024-04-25T14:00:00Z", None, "2024-04-25T14:00:00+00:00"),
+    ("2024-04-25T14:00:00", None, "2024-04-25T14:00:00+00:00"),
+    ("2024-04-25T14:00:00", "-0700", "2024-04-25T14:00:00-07:00"),
+    ("2024-04-25T14:00:00", "Not/AZone", "2024-04-25T14:00:00+00:00"),
+    ("Thu, 25 Apr 2024 10:00:00 -0400", "UTC", "2024-04-25T10:00:00-04:00"),
+    ("04/25/2024 02:00 PM", "America/Phoenix", "2024-04-25T14:00:00-07:00"),
+])
+def test_normalize_rfc3339(timestamp, timezone, expected):
+    assert normalize_rfc3339(timestamp, timezone) == expected
+
+
+def test_normalize_rfc3339_returns_none_for_unparseable_input():
+    assert normalize_rfc3339("next Tuesday after lunch", "America/New_York") is None
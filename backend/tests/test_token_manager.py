@@ -0,0 +1,89 @@
+import json
+import time
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from google.oauth2.credentials import Credentials
+from app.token_manager import TokenManager, expires_within
+
+pytestmark = pytest.mark.asyncio
+
+SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def write_token_file(path, token, expires_in):
+    path.write_text(json.dumps({
+        "token": token,
+        "refresh_token": "refresh",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": "client",
+        "client_secret": "secret",
+        "scopes": SCOPES,
+        "expiry": (utc_now() + timedelta(seconds=expires_in)).isoformat() + "Z",
+    }))
+
+
+def fake_refresh(calls):
+    """Stands in for Credentials.refresh: one slow round trip handing out a new hour-long token."""
+    def refresh(creds, request):
+        calls.append(creds.token)
+        time.sleep(0.05)
+        creds.token = f"refreshed-{len(calls)}"
+        creds.expiry = utc_now() + timedelta(hours=1)
+    return refresh
+
+
+async def test_missing_token_file_needs_a_sign_in(tmp_path):
+    assert await TokenManager(SCOPES).get(str(tmp_path / "token.json")) is None
+
+
+async def test_fresh_tokens_are_used_without_a_refresh(tmp_path):
+    token_path = tmp_path / "token.json"
+    write_token_file(token_path, "current", expires_in=3600)
+    calls = []
+
+    with patch.object(Credentials, "refresh", fake_refresh(calls)):
+        creds = await TokenManager(SCOPES).get(str(token_path))
+
+    assert creds.token == "current"
+    assert calls == []
+
+
+async def test_concurrent_requests_share_one_refresh_written_back(tmp_path):
+    token_path = tmp_path / "token.json"
+    write_token_file(token_path, "expiring", expires_in=60)
+    manager = TokenManager(SCOPES, refresh_margin=300)
+    calls = []
+
+    with patch.object(Credentials, "refresh", fake_refresh(calls)):
+        results = await asyncio.gather(*(manager.get(str(token_path)) for _ in range(5)))
+
+    assert calls == ["expiring"]
+    assert {creds.token for creds in results} == {"refreshed-1"}
+    assert json.loads(token_path.read_text())["token"] == "refreshed-1"
+    assert [path.name for path in tmp_path.iterdir()] == ["token.json"]
+
+
+async def test_background_refresh_keeps_used_accounts_ahead_of_expiry(tmp_path):
+    active, idle = tmp_path / "active.json", tmp_path / "idle.json"
+    write_token_file(active, "active", expires_in=3600)
+    write_token_file(idle, "idle", expires_in=3600)
+    manager = TokenManager(SCOPES, refresh_margin=300, keep_warm=600)
+    calls = []
+
+    with patch.object(Credentials, "refresh", fake_refresh(calls)):
+        creds = await manager.get(str(active))
+        await manager.get(str(idle))
+        manager.used_at[str(idle)] -= 3600
+        creds.expiry = utc_now() + timedelta(seconds=120)
+
+        await manager.refresh_expiring()
+
+    assert calls == ["active"]
+    assert not expires_within(creds, 300)
+    assert list(manager.accounts) == [str(active)]